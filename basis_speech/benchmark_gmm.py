@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Franz Papst
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from utils import split_training_test
+from corpus import coefficient_store
+from gm_fitting import hierachical_gaussian
+from gmm_bank import GMMBank
+from config import TRAINING_FILES, TEST_FILES, NUM_WORKERS
+
+# covariance types, numbers of components and numbers of principal components (None for no projection) to compare,
+# with one component 'tied' is the same as 'full' thus it is only compared with more components
+SETTINGS = [('full', 1, None), ('full', 4, None), ('tied', 4, None), ('diag', 1, None), ('diag', 4, None),
+            ('spherical', 4, None), ('full', 1, 50), ('full', 1, 20), ('diag', 1, 50)]
+
+def directory_size(directory):
+    """Computes the size of all files in a directory.
+
+    :params directory: the directory
+    :returns: the size in bytes
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def benchmark_gmm(training_files, test_files, settings=SETTINGS, workers=NUM_WORKERS):
+    """Compares hierarchical gaussian models with different settings.
+
+    This function trains a hierarchical gaussian model for every given setting
+    and reports the time needed for training, the size of the exported model
+    bank and the MSE of the sampled coefficients of the test files. The
+    coefficients are taken from the coefficient stores of the files.
+
+    :params training_files: a list of training files for the models
+    :params test_files: a list of test files
+    :params settings: list of tuples of the covariance type, the number of components and the number of principal components
+    :params workers: number of worker processes for encoding and training
+    :returns: list of tuples of the setting, the training time in seconds, the size in bytes and the MSE
+    """
+    training_store = coefficient_store(training_files, workers=workers)
+    test_store = coefficient_store(test_files, workers=workers)
+    X = training_store.quinphones()
+    y = training_store.phone_coefficients()
+    X_test = test_store.quinphones()
+    y_test = test_store.phone_coefficients()
+
+    results = []
+    for covariance_type, n_components, n_dimensions in settings:
+        start = time.time()
+        hgm = hierachical_gaussian(X, y, covariance_type, n_dimensions, n_components)
+        hgm.train(workers)
+        fit_time = time.time() - start
+
+        directory = tempfile.mkdtemp()
+        try:
+            hgm.export(directory)
+            size = directory_size(directory)
+            mse = np.mean((GMMBank(directory).sample(X_test, 0) - y_test)**2)
+        finally:
+            shutil.rmtree(directory)
+
+        results.append(((covariance_type, n_components, n_dimensions), fit_time, size, mse))
+
+    print('{:<12s}{:>12s}{:>12s}{:>12s}{:>12s}{:>12s}'.format('covariance', 'components', 'dimensions', 'time [s]', 'size [MB]', 'MSE'))
+    for (covariance_type, n_components, n_dimensions), fit_time, size, mse in results:
+        dimensions = 'all' if n_dimensions is None else str(n_dimensions)
+        print('{:<12s}{:>12d}{:>12s}{:>12.1f}{:>12.1f}{:>12.5f}'.format(covariance_type, n_components, dimensions, fit_time, size / 1024**2, mse))
+
+    return results
+
+
+if __name__ == '__main__':
+    # compares the settings of the hierarchical gaussian model on the training
+    # and test files of gm_fitting.py (they are created if they don't exist)
+    PREFIX = 'gmm_'
+    if not os.path.exists(PREFIX + TRAINING_FILES):
+        training_files, test_files = split_training_test(PREFIX)
+    else:
+        with open(PREFIX + TRAINING_FILES, 'r') as f:
+            training_files = [t.strip() for t in f.readlines()]
+        with open(PREFIX + TEST_FILES, 'r') as f:
+            test_files = [t.strip() for t in f.readlines()]
+
+    benchmark_gmm(training_files, test_files)
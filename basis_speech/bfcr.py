@@ -5,14 +5,96 @@
 """
 
 import os
-import pickle
+import json
+import struct
 import numpy as np
 import matplotlib.pyplot as plt
+from functools import lru_cache
 
 from label import Label
 from config import MGCORD, NUM_BASES, DATA_DIR, SAMPFREQ, FRAMESHIFT, MGC_DIR, LABEL_DIR
 from resynthesize import resynthesize
 
+BASIS_FAMILY = 'legendre'
+FILE_MAGIC = b'BFCR\x01'
+FILE_ALIGNMENT = 64
+
+@lru_cache(maxsize=None)
+def legendre_projection(num_frames, num_bases):
+    """Returns the least-squares projection onto the Legendre basis functions.
+
+    This helper function computes the pseudo-inverse of the Legendre
+    Vandermonde matrix for a phone with the given number of frames, mapping
+    the frames of a phone to the coefficients of the basis functions. It
+    scales the columns the same way np.polynomial.legendre.legfit does, thus
+    the result is the same as calling legfit for every component. Since phone
+    lengths repeat a lot in the corpus, the matrices are cached.
+
+    :params num_frames: number of frames of the phone
+    :params num_bases: number of basis functions
+    :returns: a read-only matrix of shape (num_bases, num_frames)
+    """
+    x_values = np.linspace(-1, 1, num_frames)
+    vander = np.polynomial.legendre.legvander(x_values, num_bases-1)
+    scale = np.sqrt(np.square(vander).sum(axis=0))
+    scale[scale == 0] = 1
+    projection = np.linalg.pinv(vander/scale, num_frames*np.finfo(x_values.dtype).eps) / scale[:, np.newaxis]
+    projection.setflags(write=False)
+    return projection
+
+
+@lru_cache(maxsize=1024)
+def legendre_basis(num_frames, num_bases):
+    """Returns the Legendre basis functions evaluated for a phone.
+
+    This helper function evaluates the basis functions at the frames of a phone
+    with the given number of frames. Multiplying the returned matrix with the
+    coefficients of a phone gives the recomposed frames of all components at
+    once. The matrices are kept in a LRU cache shared by all BFCR instances.
+
+    :params num_frames: number of frames of the phone
+    :params num_bases: number of basis functions
+    :returns: a read-only matrix of shape (num_frames, num_bases)
+    """
+    x_values = np.linspace(-1, 1, num_frames)
+    basis = np.polynomial.legendre.legvander(x_values, num_bases-1)
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=None)
+def legendre_nested_projection(num_frames, num_bases):
+    """Returns a QR decomposition of the Legendre basis functions for a phone.
+
+    This helper function decomposes the evaluated basis functions of a phone
+    into an orthonormal matrix Q and an upper triangular matrix R. Since R is
+    upper triangular, the first k columns of Q and the upper left k x k block
+    of the inverse of R give the least-squares fit for only the first k basis
+    functions, thus one decomposition can be used for all lower numbers of
+    basis functions. This only holds if the phone has at least as many frames
+    as basis functions.
+
+    :params num_frames: number of frames of the phone
+    :params num_bases: highest number of basis functions
+    :returns: a read-only matrix Q of shape (num_frames, num_bases)
+    :returns: a read-only inverse of R of shape (num_bases, num_bases)
+    """
+    q, r = np.linalg.qr(legendre_basis(num_frames, num_bases))
+    r_inv = np.linalg.inv(r)
+    q.setflags(write=False)
+    r_inv.setflags(write=False)
+    return q, r_inv
+
+
+def aligned_offset(offset):
+    """Rounds a byte offset up to the alignment of arrays in saved BFCR files.
+
+    :params offset: the offset to align
+    :returns: the aligned offset
+    """
+    return -(-offset // FILE_ALIGNMENT) * FILE_ALIGNMENT
+
+
 class BFCR:
 
     """ This class is a basis function representation of a given feature.
@@ -35,6 +117,7 @@ class BFCR:
         self._encoded_features = {}
         self._len_phones = {}
         self._original_matrix = {}
+        self._phone_ids = None
         if label_file:
             self.label = Label(label_file)
             self.label_file = label_file
@@ -54,12 +137,27 @@ class BFCR:
         else:
             raise Exception('Label is already loaded')
 
+    def set_encoded_feature(self, feature_name, coefficients, phone_frames, original_matrix=None):
+        """Sets a feature which was already encoded somewhere else.
+
+        :params feature_name: name of the encoded feature
+        :params coefficients: coefficient tensor of shape (phones, components, bases)
+        :params phone_frames: first and last frame of every phone
+        :params original_matrix: the matrix the feature was encoded from
+        """
+        self._encoded_features[feature_name] = coefficients
+        self._len_phones[feature_name] = [tuple(i) for i in np.asarray(phone_frames).tolist()]
+        if original_matrix is not None:
+            self._original_matrix[feature_name] = original_matrix
+
     def encode_feature(self, feature_matrix, feature_name, num_bases=NUM_BASES):
         """Encodes a given feature.
 
         This method decomposes a given matrix into a matrix of cofficents of
         lengrande basis functions. The default value of basis functions to
-        encode the matrix is given in config.py.
+        encode the matrix is given in config.py. All components of a phone are
+        projected at once, using a cached projection matrix for the length of
+        the phone.
 
         :params feature_matrix: matrix to encode
         :params feature_name: name of the encoded feature
@@ -70,31 +168,81 @@ class BFCR:
             raise Exception('No label file was loaded')
 
         num_components = feature_matrix.shape[1]
-        step_size = feature_matrix.shape[0]/self.label.last_phone_end
         tensor = np.empty((self.label.num_phones, num_components, num_bases), dtype=np.float32)
-        self._len_phones[feature_name] = []
+        self._len_phones[feature_name] = self._phone_indices(feature_matrix.shape[0])
         self._original_matrix[feature_name] = feature_matrix
 
-        for i,phone in enumerate(self.label.cur_phones_additions()):
-            phone_begin_index = int(round(phone[1]*step_size))
-            phone_end_index = int(round(phone[2]*step_size))
+        for i,(phone_begin_index,phone_end_index) in enumerate(self._len_phones[feature_name]):
+            signal_snippet = feature_matrix[phone_begin_index:phone_end_index,:]
+            projection = legendre_projection(signal_snippet.shape[0], num_bases)
+            tensor[i, :, :] = np.dot(projection, signal_snippet).T
 
-            self._len_phones[feature_name].append((phone_begin_index,phone_end_index))
+        self._encoded_features[feature_name] = tensor
 
-            for component in range(num_components):
-                signal_snippet = feature_matrix[phone_begin_index:phone_end_index,component]
-                x_values = np.linspace(-1, 1, len(signal_snippet))
-                coeff = np.polynomial.legendre.legfit(x_values, signal_snippet, num_bases-1)
-                tensor[i, component, :] = coeff
+    def encode_feature_multi(self, feature_matrix, feature_name, orders):
+        """Encodes a given feature for several numbers of basis functions at once.
 
-        self._encoded_features[feature_name] = tensor
+        This method does the same as encode_feature() for every number of
+        basis functions in orders, but fits every phone only once. The fit for
+        the highest number of basis functions is done with a QR decomposition,
+        the fits and reconstructions for the lower numbers are truncations of
+        it. The feature stays encoded with the highest number of basis
+        functions.
+
+        :params feature_matrix: matrix to encode
+        :params feature_name: name of the encoded feature
+        :params orders: list of the numbers of basis functions to encode
+        :returns: a dict with the coefficient tensor for every number of basis functions
+        :returns: a dict with the recomposed matrix for every number of basis functions
+        :raises Exception: if no label is loaded
+        """
+        if self.label is None:
+            raise Exception('No label file was loaded')
+
+        orders = sorted(set(orders))
+        max_order = orders[-1]
+        num_components = feature_matrix.shape[1]
+        phone_indices = self._phone_indices(feature_matrix.shape[0])
+        utterance_length = max(max(phone_indices))
+
+        coefficients = {k:np.empty((self.label.num_phones, num_components, k), dtype=np.float32) for k in orders}
+        reconstructions = {k:np.zeros((utterance_length, num_components), dtype=np.float32) for k in orders}
+
+        for i,(phone_begin_index,phone_end_index) in enumerate(phone_indices):
+            signal_snippet = feature_matrix[phone_begin_index:phone_end_index,:]
+            num_frames = signal_snippet.shape[0]
+
+            if num_frames >= max_order:
+                q, r_inv = legendre_nested_projection(num_frames, max_order)
+                projected = np.dot(q.T, signal_snippet)
+                reconstructed = np.zeros((num_frames, num_components))
+                prev_order = 0
+
+                for k in orders:
+                    coefficients[k][i, :, :] = np.dot(r_inv[:k,:k], projected[:k]).T
+                    reconstructed += np.dot(q[:,prev_order:k], projected[prev_order:k])
+                    reconstructions[k][phone_begin_index:phone_end_index] = reconstructed
+                    prev_order = k
+            else:
+                # too few frames for a full rank fit, fall back to the regular projection
+                for k in orders:
+                    coeff = np.dot(legendre_projection(num_frames, k), signal_snippet)
+                    coefficients[k][i, :, :] = coeff.T
+                    reconstructions[k][phone_begin_index:phone_end_index] = np.dot(legendre_basis(num_frames, k), coeff)
+
+        self._len_phones[feature_name] = phone_indices
+        self._original_matrix[feature_name] = feature_matrix
+        self._encoded_features[feature_name] = coefficients[max_order]
+
+        return coefficients, reconstructions
 
     def decode_feature(self, feature_name, blending_time=None):
         """ Decodes a given feature.
         This method recomposes the matrix of basis function coefficients into a
         regular feature matrix. If blending_time is set the returned matrix
         will over the phone boarder for a given amount of milliseconds in both
-        directions. By default no blending time is used.
+        directions. By default no blending time is used. All components of a
+        phone are evaluated at once, using cached basis matrices.
 
         :params feature_name: name of the feature to decode
         :params blending_time: time to blend over the phone borders
@@ -105,56 +253,130 @@ class BFCR:
         utterance_length = max(max(self._len_phones[feature_name]))
         reconstructed_matrix = np.zeros((utterance_length, self._encoded_features[feature_name].shape[1]), dtype=np.float32)
 
+        num_bases = self._encoded_features[feature_name].shape[2]
+
         for phone in range(len(self._len_phones[feature_name])):
             cur_phone_start = self._len_phones[feature_name][phone][0]
             cur_phone_end = self._len_phones[feature_name][phone][1]
             resample_size = len(range(cur_phone_start, cur_phone_end))
-            x_values = np.linspace(-1, 1, resample_size)
-            coeff = self._encoded_features[feature_name][phone][:][:]
-            signal_snippet = np.zeros((len(x_values), coeff.shape[0]), dtype=np.float32)
-
-            for i in range(coeff.shape[0]):
-                signal_snippet[:,i] = np.polynomial.legendre.legval(x_values, coeff[i,:])
+            coeff = self._encoded_features[feature_name][phone]
+            basis = legendre_basis(resample_size, num_bases)
 
-            reconstructed_matrix[cur_phone_start:cur_phone_end] = signal_snippet
+            reconstructed_matrix[cur_phone_start:cur_phone_end] = np.dot(basis, coeff.T)
 
         if blending_time:
             reconstructed_matrix = self._blend_borders(feature_name, reconstructed_matrix, blending_time)
 
         return reconstructed_matrix
 
-    def save_to_file(self, filename):
+    def save_to_file(self, filename, original_files=None):
         """Saves the bfcr instance into a binary file
 
+        The file starts with a JSON header, followed by the raw coefficient
+        tensors and phone frame boundaries of all encoded features, so it can
+        be memory-mapped when reading. The label is only referenced by its
+        filename and the phone identities are stored in the header. If a
+        filename is given for the original matrix of a feature (e.g. the *.mgc
+        file it was read from), the matrix is referenced instead of copied.
+
         :params filename: name of the file where to save the BFCR instance
+        :params original_files: dict with the filenames of the original matrices of the features
         """
-        with open(filename, 'wb') as f:
-            pickle.dump(self, f)
+        if original_files is None:
+            original_files = {}
 
-    def read_from_file(self, filename):
+        header = {'label_file': self.label_file, 'phone_ids': self.phone_ids, 'features': {}}
+        arrays = []
+        offset = 0
+
+        for feature_name in self._encoded_features.keys():
+            self._check_feature(feature_name)
+            feature = {'original_file': original_files.get(feature_name)}
+            to_store = [('coefficients', np.ascontiguousarray(self._encoded_features[feature_name], dtype=np.float32)),
+                        ('phone_indices', np.array(self._len_phones[feature_name], dtype=np.int64).reshape(-1, 2))]
+            if feature['original_file'] is None and feature_name in self._original_matrix:
+                to_store.append(('original_matrix', np.ascontiguousarray(self._original_matrix[feature_name], dtype=np.float32)))
+
+            for key, array in to_store:
+                offset = aligned_offset(offset)
+                feature[key] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+                arrays.append((offset, array))
+                offset += array.nbytes
+
+            header['features'][feature_name] = feature
+
+        header = json.dumps(header).encode('utf-8')
+        data_start = aligned_offset(len(FILE_MAGIC) + 4 + len(header))
+
+        with open(filename, 'wb') as f:
+            f.write(FILE_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for offset, array in arrays:
+                f.seek(data_start + offset)
+                f.write(array.tobytes())
+
+    def read_from_file(self, filename, load_label=True):
         """Loads a previous saved bfcr instance
 
+        The coefficient tensors are memory-mapped read-only. Original matrices
+        which were saved as a reference are memory-mapped from their file. By
+        default the referenced label file is parsed again, if that is not
+        needed it can be skipped, the phone identities are available anyway.
+
         :params filename: name of the file to load the bfcr instance
+        :params load_label: whether to parse the referenced label file or not
+        :raises Exception: if the file is not a saved bfcr instance
         """
         with open(filename, 'rb') as f:
-            restored = pickle.load(f)
-            self.label = restored.label
-            self._encoded_features = restored._encoded_features
-            self._len_phones = restored._len_phones
-            self._original_matrix = restored._original_matrix
-            self.label_file = restored.label_file
-
-    def plot_component(self, feature_name, filename, component_num=0):
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise Exception('{:s} is not a saved BFCR instance'.format(filename))
+            header_length = struct.unpack('<I', f.read(4))[0]
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        data_start = aligned_offset(len(FILE_MAGIC) + 4 + header_length)
+
+        self.label_file = header['label_file']
+        self._phone_ids = header['phone_ids']
+        if load_label and self.label_file:
+            self.label = Label(self.label_file)
+        else:
+            self.label = None
+
+        self._encoded_features = {}
+        self._len_phones = {}
+        self._original_matrix = {}
+
+        for feature_name, feature in header['features'].items():
+            arrays = {}
+            for key in ('coefficients', 'phone_indices', 'original_matrix'):
+                if key in feature:
+                    arrays[key] = np.memmap(filename, dtype=feature[key]['dtype'], mode='r',
+                                            offset=data_start + feature[key]['offset'], shape=tuple(feature[key]['shape']))
+
+            self._encoded_features[feature_name] = arrays['coefficients']
+            self._len_phones[feature_name] = [tuple(i) for i in arrays['phone_indices'].tolist()]
+
+            if feature['original_file'] is not None:
+                num_components = arrays['coefficients'].shape[1]
+                self._original_matrix[feature_name] = np.memmap(feature['original_file'], dtype=np.float32, mode='r').reshape(-1, num_components)
+            elif 'original_matrix' in arrays:
+                self._original_matrix[feature_name] = arrays['original_matrix']
+
+    def plot_component(self, feature_name, filename, component_num=0, reconstructed_matrix=None):
         """Plots a component of a given feature
 
         This method creates a plot of a given feature and the original matrix
         of this feature. By default it plots only the first component of the
-        matix.
+        matix. If no reconstructed matrix is given, the feature gets decoded.
 
         :params feature_name: name of the feature to plot
         :params filename: name of the file where the plot gets saved
         :params component_num: number of the component to plot
+        :params reconstructed_matrix: an already recomposed matrix of the feature
         """
+        if reconstructed_matrix is None:
+            reconstructed_matrix = self.decode_feature(feature_name)
+
         path = os.path.dirname(filename)
         if not os.path.exists(path):
             os.makedirs(path)
@@ -163,7 +385,7 @@ class BFCR:
         f, ax = plt.subplots(1, 1, figsize=(18,6))
         x = np.linspace(0, xmax, xmax)
         ax.plot(x, self._original_matrix[feature_name][:,component_num], label='Original')
-        ax.plot(x, self.decode_feature(feature_name)[:,component_num], '.', label='Reconstructed')
+        ax.plot(x, reconstructed_matrix[:,component_num], '.', label='Reconstructed')
         ax.set_xlim(xmin=0, xmax=xmax)
         ax.legend()
         f.savefig(filename)
@@ -177,12 +399,28 @@ class BFCR:
         """
         return self._original_matrix[feature_name]
 
+    def phone_frames(self, feature_name):
+        """Getter for the first and last frame of every phone.
+
+        :params feature_name: the feature of which to get the phone frames
+        :returns: list of tuples with the begin and end index of every phone
+        """
+        self._check_feature(feature_name)
+        return self._len_phones[feature_name]
+
     def phone_coefficients(self, feature_name):
         """Get for basis function coefficients for all the phones. """
         self._check_feature(feature_name)
         num_phones = self._encoded_features[feature_name].shape[0]
         return np.reshape(self._encoded_features[feature_name], (num_phones, (MGCORD+1) * NUM_BASES))
 
+    @property
+    def phone_ids(self):
+        """Get the identities of the current phones."""
+        if self.label is not None:
+            return list(self.label.cur_phones())
+        return self._phone_ids
+
     @property
     def encoded_features(self):
         """Get all encoded features."""
@@ -197,15 +435,21 @@ class BFCR:
         if type(value) is not dict:
             raise TypeError('encoded_features has to be assigned to a dict')
 
+        step_size = SAMPFREQ / FRAMESHIFT
+        phone_indices = [tuple(i) for i in self.label.phone_frames(step_size).tolist()]
+
         for i in value.keys():
             self._encoded_features[i] = value[i]
-            step_size = SAMPFREQ / FRAMESHIFT
-            self._len_phones[i] = []
-            for phone in self.label.cur_phones_additions():
-                phone_begin_index = int(round(phone[1]*step_size))
-                phone_end_index = int(round(phone[2]*step_size))
+            self._len_phones[i] = list(phone_indices)
 
-                self._len_phones[i].append((phone_begin_index,phone_end_index))
+    def _phone_indices(self, num_frames):
+        """Computes the first and last frame of every phone.
+
+        :params num_frames: number of frames of the feature matrix
+        :returns: list of tuples with the begin and end index of every phone
+        """
+        step_size = num_frames/self.label.last_phone_end
+        return [tuple(i) for i in self.label.phone_frames(step_size).tolist()]
 
     def _blend_borders(self, feature_name, matrix, blending_time=25):
         """Blends over the borders of one phone to the next.
@@ -220,32 +464,57 @@ class BFCR:
         :returns: the given matrix with blended phone borders
         """
         blending_time = 1/1000*blending_time
-        phone_borders = [phone[2] for phone in self.label.cur_phones_additions()]
+        phone_borders = self.label.ends
 
         last_time = phone_borders[-1]
         last_index = self._len_phones[feature_name][-1][1]
         step = last_time/last_index
 
-        for i in range(len(phone_borders)):
-            if i == 0 or i == len(phone_borders)-1:
-                continue
-
-            if phone_borders[i]-blending_time < phone_borders[i-1] or phone_borders[i]+blending_time > phone_borders[i+1]:
-                continue
-
-            start = phone_borders[i] - blending_time
-            end = phone_borders[i] + blending_time
-
-            blend_index_start = round(start/step)
-            blend_index_end = round(end/step)-1
-
-            blend_start_values = matrix[blend_index_start, :]
-            blend_end_values= matrix[blend_index_end, :]
-            blend_factors = np.linspace(1,0, blend_index_end-blend_index_start)
-
-            for j in range(len(blend_factors)):
-                blend_factor = blend_factors[j]
-                matrix[blend_index_start+j, :] = blend_factor*blend_start_values[:] + (1-blend_factor)*blend_end_values[:]
+        # only the inner borders whose blending window fits into both neighbouring phones are blended
+        borders = phone_borders[1:-1]
+        valid = (borders-blending_time >= phone_borders[:-2]) & (borders+blending_time <= phone_borders[2:])
+        borders = borders[valid]
+
+        blend_index_start = np.round((borders-blending_time)/step).astype(int)
+        blend_index_end = np.round((borders+blending_time)/step).astype(int)-1
+        blend_length = blend_index_end - blend_index_start
+
+        non_empty = blend_length > 0
+        blend_index_start = blend_index_start[non_empty]
+        blend_index_end = blend_index_end[non_empty]
+        blend_length = blend_length[non_empty]
+
+        if len(blend_length) == 0:
+            return matrix
+
+        # window, offset in the window and blend factor (same as np.linspace(1, 0, blend_length)) for every blended frame
+        window = np.repeat(np.arange(len(blend_length)), blend_length)
+        window_begin = np.cumsum(blend_length) - blend_length
+        offset = np.arange(len(window)) - window_begin[window]
+        length = blend_length[window]
+        blend_factors = offset*(-1.0/np.maximum(length-1, 1)) + 1
+        blend_factors[offset == length-1] = 0
+        blend_factors[length == 1] = 1
+
+        blend_start_values = matrix[blend_index_start, :]
+        blend_end_values = matrix[blend_index_end, :]
+
+        # a window overlapping the previous one starts (or ends) on a frame that is already blended
+        for i in np.flatnonzero(blend_index_start[1:] < blend_index_end[:-1]) + 1:
+            for values, index in ((blend_start_values, blend_index_start), (blend_end_values, blend_index_end)):
+                prev_offset = index[i] - blend_index_start[i-1]
+                if prev_offset < blend_length[i-1]:
+                    blend_factor = blend_factors[window_begin[i-1] + prev_offset]
+                    values[i, :] = blend_factor*blend_start_values[i-1, :] + (1-blend_factor)*blend_end_values[i-1, :]
+
+        # frames covered by two windows get the values of the later one
+        next_start = np.append(blend_index_start[1:], matrix.shape[0])
+        keep = blend_index_start[window] + offset < next_start[window]
+        window = window[keep]
+        rows = blend_index_start[window] + offset[keep]
+        blend_factors = blend_factors[keep, np.newaxis]
+
+        matrix[rows, :] = blend_factors*blend_start_values[window, :] + (1-blend_factors)*blend_end_values[window, :]
 
         return matrix
 
@@ -327,9 +596,10 @@ if __name__ == '__main__':
 
         resynthesize(mgc_matrix, lf0_filename, '{0:s}/{1:s}_original.wav'.format(out_dir,in_file))
 
+        _, reconstructions = bfcr.encode_feature_multi(mgc_matrix, 'mgc', range(1,26))
+
         for j in range(1,26):
-            bfcr.encode_feature(mgc_matrix, 'mgc', j)
-            bfcr.plot_component('mgc', 'phone_plots/bfcr_reconstructed/{0:s}/{0:s}_mgc_{1:02d}_basefunctions.png'.format(in_file,j), 0)
-            reconstructed_mgc = bfcr.decode_feature('mgc')
+            reconstructed_mgc = reconstructions[j]
+            bfcr.plot_component('mgc', 'phone_plots/bfcr_reconstructed/{0:s}/{0:s}_mgc_{1:02d}_basefunctions.png'.format(in_file,j), 0, reconstructed_mgc)
 
             resynthesize(reconstructed_mgc, lf0_filename, '{0:s}/{1:s}_reconstructed_{2:02d}_basefunctions.wav'.format(out_dir,in_file,j))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Franz Papst
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+from bfcr import BFCR, BASIS_FAMILY
+from config import CACHE_DIR, CACHE_SIZE
+
+class EncodingCache:
+
+    """An on-disk cache for encoded mgc files.
+
+    This class stores BFCR instances (in the format of BFCR.save_to_file())
+    under a key made of the paths, sizes and modification times of the label
+    and the mgc file, the number of basis functions and the used basis
+    functions. If one of those changes the key changes too, thus outdated
+    entries are never used. Once the cache exceeds its maximum size the least
+    recently used entries are removed.
+
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_SIZE):
+        """Initialises the cache in a given directory.
+
+        By default the directory and the maximum size in bytes are the ones
+        stored in config.py.
+
+        :params directory: the directory of the cache
+        :params max_size: the maximum size of the cache in bytes
+        """
+        self._directory = directory
+        self._max_size = max_size
+
+    def load(self, label_file, mgc_file, num_bases):
+        """Loads a cached BFCR instance.
+
+        :params label_file: the label file of the instance
+        :params mgc_file: the mgc file of the instance
+        :params num_bases: the number of basis functions of the instance
+        :returns: the cached BFCR instance or None if it is not cached
+        """
+        filename = self._filename(label_file, mgc_file, num_bases)
+        bfcr = BFCR()
+
+        try:
+            bfcr.read_from_file(filename, load_label=False)
+            os.utime(filename)
+        except Exception:
+            # missing, evicted or unreadable entries are just cache misses
+            return None
+
+        bfcr.load_label(label_file)
+        return bfcr
+
+    def store(self, bfcr, label_file, mgc_file, num_bases):
+        """Stores a BFCR instance in the cache.
+
+        The instance is written to a temporary file first and renamed
+        afterwards, thus processes using the same cache never see partly
+        written entries. The mgc matrix is only referenced.
+
+        :params bfcr: the BFCR instance to store
+        :params label_file: the label file of the instance
+        :params mgc_file: the mgc file of the instance
+        :params num_bases: the number of basis functions of the instance
+        """
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory, exist_ok=True)
+
+        filename = self._filename(label_file, mgc_file, num_bases)
+        fd, tmp_filename = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        os.close(fd)
+        bfcr.save_to_file(tmp_filename, {'mgc': os.path.abspath(mgc_file)})
+        os.replace(tmp_filename, filename)
+
+        self._evict()
+
+    def _filename(self, label_file, mgc_file, num_bases):
+        """Computes the filename of a cache entry.
+
+        :params label_file: the label file of the entry
+        :params mgc_file: the mgc file of the entry
+        :params num_bases: the number of basis functions of the entry
+        :returns: the filename of the entry
+        """
+        key = [BASIS_FAMILY, num_bases]
+        for f in (label_file, mgc_file):
+            stat = os.stat(f)
+            key += [os.path.abspath(f), stat.st_size, stat.st_mtime_ns]
+
+        key = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, key + '.bfcr')
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits its maximum size."""
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith('.bfcr'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(e[1] for e in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
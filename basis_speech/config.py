@@ -20,5 +20,12 @@ LF0_DIR = DATA_DIR + 'lf0/'
 COMPONENTS_TO_PLOT = 1
 TEST_FILES = 'test_files.txt'
 TRAINING_FILES = 'training_files.txt'
-GMM_SAVED = 'TRAINED_GMM.pickle'
+GMM_BANK = 'TRAINED_GMM/'
 REGRESSION_SAVED = 'TRAINED_REGRESSION.pickle'
+CORPUS_DIR = 'corpus/'
+NUM_WORKERS = 8
+CACHE_DIR = 'cache/'
+CACHE_SIZE = 512 * 1024**2
+MODEL_DIR = 'models/'
+MODEL_MEMORY = 2 * 1024**3
+BATCH_SIZE = 4096
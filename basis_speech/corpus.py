@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Franz Papst
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from utils import encode_many, phone_to_num
+from phone import NUMERIC_FIELDS, CATEGORICAL_FIELDS
+from features import feature_matrix, feature_names
+from config import LABEL_DIR, MGC_DIR, MGCORD, NUM_BASES, CORPUS_DIR, NUM_WORKERS
+
+# version of the layout of a store, stores of other versions are built again
+STORE_VERSION = 2
+# number of phones converted at once when writing the targets of the regression models
+REGRESSION_CHUNK = 65536
+
+class CoefficientStore:
+
+    """The encoded coefficients of a whole corpus, memory-mapped from disk.
+
+    This class holds the basis function coefficients of all phones of a list
+    of files in one memory-mapped array, together with the quin-phones of the
+    phones (as numerical values), the numerical and categorical context fields
+    of the phones and the frames of the phones. An offset index
+    gives the phones of every file, thus the data of a file is just a view into
+    these arrays and neither the labels nor the mgc files have to be parsed
+    again. A store is created with the function build_coefficient_store().
+
+    """
+
+    def __init__(self, directory):
+        """Opens a store in the given directory.
+
+        :params directory: the directory of the store
+        """
+        with open(os.path.join(directory, 'index.json'), 'r') as f:
+            index = json.load(f)
+
+        self._directory = directory
+        self._files = index['files']
+        self._key = index.get('key')
+        self._phones = index['phones']
+        self._num_bases = index['num_bases']
+        self._categories = index['categories']
+        self._file_index = {f:i for i,f in enumerate(self._files)}
+
+        self._offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        self._coefficients = np.load(os.path.join(directory, 'coefficients.npy'), mmap_mode='r')
+        self._contexts = np.load(os.path.join(directory, 'contexts.npy'), mmap_mode='r')
+        self._phone_frames = np.load(os.path.join(directory, 'phone_frames.npy'), mmap_mode='r')
+        self._numeric_contexts = np.load(os.path.join(directory, 'numeric_contexts.npy'), mmap_mode='r')
+        self._categorical_contexts = np.load(os.path.join(directory, 'categorical_contexts.npy'), mmap_mode='r')
+
+    def coefficients(self, filename=None):
+        """Getter for the coefficient tensor of one file or of the whole corpus.
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :returns: read-only array of shape (phones, MGCORD+1, NUM_BASES)
+        """
+        return self._coefficients[self._slice(filename)]
+
+    def phone_coefficients(self, filename=None):
+        """Getter for the coefficients of every phone as one row.
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :returns: read-only array of shape (phones, (MGCORD+1) * NUM_BASES)
+        """
+        coefficients = self.coefficients(filename)
+        return coefficients.reshape(coefficients.shape[0], -1)
+
+    def contexts(self, filename=None):
+        """Getter for the numerical values of the quin-phones.
+
+        Missing phones (at the beginning and the end of a file) are -1, the
+        other values are the ones given by phone_values.
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :returns: read-only array of shape (phones, 5)
+        """
+        return self._contexts[self._slice(filename)]
+
+    def quinphones(self, filename=None):
+        """Getter for the quin-phones as strings.
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :returns: list of quin-phone tuples, missing phones are None
+        """
+        names = np.array(self._phones + [None], dtype=object)
+        return [tuple(q) for q in names[self.contexts(filename)].tolist()]
+
+    def numeric_contexts(self, filename=None):
+        """Getter for the numerical context fields (see Label.numeric_contexts).
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :returns: read-only array of shape (phones, len(NUMERIC_FIELDS))
+        """
+        return self._numeric_contexts[self._slice(filename)]
+
+    def categorical_contexts(self, filename=None):
+        """Getter for the categorical context fields as integer codes.
+
+        Missing values are -1, the other values are the indices into the lists
+        given by categories.
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :returns: read-only array of shape (phones, len(CATEGORICAL_FIELDS))
+        """
+        return self._categorical_contexts[self._slice(filename)]
+
+    def features(self, filename=None, sparse=False):
+        """Getter for the full-context feature matrix (see features.feature_matrix()).
+
+        :params filename: name of the file, if None the whole corpus is returned
+        :params sparse: whether to return a sparse CSR matrix or a dense array
+        :returns: matrix of shape (phones, number of features)
+        """
+        num_categories = [len(self._categories[field]) for field in CATEGORICAL_FIELDS]
+        return feature_matrix(self.contexts(filename), self.numeric_contexts(filename),
+                              self.categorical_contexts(filename), len(self._phones),
+                              num_categories, sparse)
+
+    @property
+    def feature_names(self):
+        """Getter for the names of the columns of the feature matrix."""
+        return feature_names(self._phones, self._categories)
+
+    def phone_frames(self, filename):
+        """Getter for the first and last frame of every phone of a file.
+
+        :params filename: name of the file
+        :returns: read-only array of shape (phones, 2)
+        """
+        return self._phone_frames[self._slice(filename)]
+
+    def regression_data(self):
+        """Writes the input and the targets of the regression models.
+
+        The numerical values of the quin-phones are written as float32 and the
+        coefficients as a C-contiguous float64 matrix, which are the types the
+        sklearn estimators use internally. Processes which memory-map these
+        files share them and the estimators don't need to convert them into
+        private copies. The files are only written once per store, the
+        coefficients are converted in chunks.
+
+        :returns: the filenames of the input and the targets
+        """
+        X_file = os.path.join(self._directory, 'regression_X.npy')
+        y_file = os.path.join(self._directory, 'regression_y.npy')
+
+        if not os.path.exists(X_file):
+            np.save(X_file + '.tmp.npy', np.asarray(self._contexts, dtype=np.float32))
+            os.replace(X_file + '.tmp.npy', X_file)
+
+        if not os.path.exists(y_file):
+            coefficients = self.phone_coefficients()
+            y = np.lib.format.open_memmap(y_file + '.tmp.npy', mode='w+', dtype=np.float64, shape=coefficients.shape)
+            for begin in range(0, len(y), REGRESSION_CHUNK):
+                y[begin:begin+REGRESSION_CHUNK] = coefficients[begin:begin+REGRESSION_CHUNK]
+            y.flush()
+            del y
+            os.replace(y_file + '.tmp.npy', y_file)
+
+        return X_file, y_file
+
+    @property
+    def directory(self):
+        """Getter for the directory of the store."""
+        return self._directory
+
+    @property
+    def key(self):
+        """Getter for the key of the store (see store_key())."""
+        return self._key
+
+    @property
+    def files(self):
+        """Getter for the names of the files in the store."""
+        return self._files
+
+    @property
+    def num_bases(self):
+        """Getter for the number of basis functions of the coefficients."""
+        return self._num_bases
+
+    @property
+    def categories(self):
+        """Getter for the values of every categorical context field."""
+        return self._categories
+
+    @property
+    def phone_values(self):
+        """Getter for the directory containing the numerical values of phones."""
+        return phone_to_num(self._phones)
+
+    def _slice(self, filename):
+        """Returns the slice of the phones of a file.
+
+        :params filename: name of the file, if None the whole corpus is sliced
+        :returns: slice for the arrays of the store
+        """
+        if filename is None:
+            return slice(None)
+
+        i = self._file_index[os.path.splitext(os.path.basename(filename))[0]]
+        return slice(self._offsets[i], self._offsets[i+1])
+
+
+def store_key(files):
+    """Computes the key of a store for the given files.
+
+    Like the key of the encoding cache, the key is made of the names, sizes
+    and modification times of the label and the mgc files, the number of basis
+    functions and the version of the store, thus a store is never used once
+    one of them changes.
+
+    :params files: list of names of the files in the store
+    :returns: the key as hex string
+    """
+    key = [NUM_BASES, STORE_VERSION]
+    for f in files:
+        for filename in (LABEL_DIR + f + '.lab', MGC_DIR + f + '.mgc'):
+            stat = os.stat(filename)
+            key += [f, stat.st_size, stat.st_mtime_ns]
+    return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+def build_coefficient_store(files, directory, workers=NUM_WORKERS):
+    """Encodes all given files into a new coefficient store.
+
+    This function creates the store in two passes. At first it counts the
+    phones of all label files to allocate the memory-mapped arrays, then it
+    encodes the files in a pool of processes and copies the coefficients of
+    every file into the store as soon as it is encoded. The inputs of the
+    regression models of a previous store in the same directory are removed
+    (see CoefficientStore.regression_data()).
+
+    :params files: list of files to encode
+    :params directory: the directory where the store is created
+    :params workers: number of worker processes used for encoding
+    :returns: an instance of CoefficientStore
+    """
+    files = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for filename in ('regression_X.npy', 'regression_y.npy'):
+        if os.path.exists(os.path.join(directory, filename)):
+            os.remove(os.path.join(directory, filename))
+
+    num_phones = []
+    for f in files:
+        with open(LABEL_DIR + f + '.lab', 'r') as label:
+            num_phones.append(len(label.readlines()))
+
+    offsets = np.zeros(len(files)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(num_phones)
+    total_phones = int(offsets[-1])
+
+    coefficients = np.lib.format.open_memmap(os.path.join(directory, 'coefficients.npy'), mode='w+', dtype=np.float32, shape=(total_phones, MGCORD+1, NUM_BASES))
+    contexts = np.lib.format.open_memmap(os.path.join(directory, 'contexts.npy'), mode='w+', dtype=np.int32, shape=(total_phones, 5))
+    phone_frames = np.lib.format.open_memmap(os.path.join(directory, 'phone_frames.npy'), mode='w+', dtype=np.int64, shape=(total_phones, 2))
+    numeric_contexts = np.lib.format.open_memmap(os.path.join(directory, 'numeric_contexts.npy'), mode='w+', dtype=np.float32, shape=(total_phones, len(NUMERIC_FIELDS)))
+    categorical_contexts = np.lib.format.open_memmap(os.path.join(directory, 'categorical_contexts.npy'), mode='w+', dtype=np.int32, shape=(total_phones, len(CATEGORICAL_FIELDS)))
+
+    # phones and categories are numbered in order of appearance first and renumbered alphabetically at the end
+    vocabulary = {'None':0}
+    category_vocabularies = [{} for field in CATEGORICAL_FIELDS]
+    for i,encoded in enumerate(encode_many(files, workers, contexts=True)):
+        begin, end = offsets[i], offsets[i+1]
+        coefficients[begin:end] = encoded.coefficients
+        phone_frames[begin:end] = encoded.phone_frames
+        # the last entry keeps missing phones at the value of 'None'
+        file_values = np.array([vocabulary.setdefault(str(p), len(vocabulary)) for p in encoded.phone_names] + [0], dtype=np.int32)
+        contexts[begin:end] = file_values[encoded.quinphone_codes]
+        numeric_contexts[begin:end] = encoded.numeric_contexts
+        for j,values in enumerate(category_vocabularies):
+            categorical_contexts[begin:end,j] = [-1 if v is None else values.setdefault(v, len(values)) for v in encoded.categorical_contexts[:,j]]
+
+    phone_values = phone_to_num(set(vocabulary.keys()) - {'None'})
+    renumber = np.array([phone_values[k] for k in vocabulary.keys()], dtype=np.int32)
+    contexts[:] = renumber[contexts]
+
+    categories = {}
+    for j,(field,values) in enumerate(zip(CATEGORICAL_FIELDS, category_vocabularies)):
+        categories[field] = sorted(values.keys())
+        # the last entry keeps missing values (-1) at -1
+        renumber = np.full(len(values)+1, -1, dtype=np.int32)
+        renumber[list(values.values())] = [categories[field].index(k) for k in values.keys()]
+        categorical_contexts[:,j] = renumber[categorical_contexts[:,j]]
+
+    for array in (coefficients, contexts, phone_frames, numeric_contexts, categorical_contexts):
+        array.flush()
+    del coefficients, contexts, phone_frames, numeric_contexts, categorical_contexts
+    np.save(os.path.join(directory, 'offsets.npy'), offsets)
+
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump({'version': STORE_VERSION, 'key': store_key(files), 'files': files, 'phones': [k for k in phone_values.keys() if k != 'None'],
+                   'num_bases': NUM_BASES, 'categories': categories}, f)
+
+    return CoefficientStore(directory)
+
+
+def coefficient_store(files, directory=None, workers=NUM_WORKERS):
+    """Opens the coefficient store for the given files, builds it if needed.
+
+    By default the store is located in a subdirectory of CORPUS_DIR (set in
+    config.py) named after the key of the store (see store_key()), thus it is
+    built only once for the same files and the same layout of the store. An
+    existing store is only used if its version and its key match, else it is
+    built again.
+
+    :params files: list of files in the store
+    :params directory: the directory of the store
+    :params workers: number of worker processes used for encoding
+    :returns: an instance of CoefficientStore
+    """
+    files = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    key = store_key(files)
+    if directory is None:
+        directory = CORPUS_DIR + key[:16] + '/'
+
+    if os.path.exists(os.path.join(directory, 'index.json')):
+        with open(os.path.join(directory, 'index.json'), 'r') as f:
+            index = json.load(f)
+        if index.get('version') == STORE_VERSION and index.get('key') == key:
+            return CoefficientStore(directory)
+
+    return build_coefficient_store(files, directory, workers)
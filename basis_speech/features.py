@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Franz Papst
+"""
+
+import numpy as np
+from scipy import sparse as sp
+
+from phone import NUMERIC_FIELDS, CATEGORICAL_FIELDS
+
+QUINPHONE_POSITIONS = ['LL', 'L', 'C', 'R', 'RR']
+
+def feature_matrix(quinphones, numeric_contexts, categorical_contexts, num_phones, num_categories, sparse=False):
+    """Builds the numerical feature matrix from integer coded contexts.
+
+    The matrix consists of the one-hot encoded quin-phones, followed by the
+    numerical context fields and the one-hot encoded categorical context
+    fields. Missing phones and categories (coded as -1) have no one-hot entry,
+    missing numerical values are -1. Every block is built with one vectorized
+    operation, thus there is no loop over the phones.
+
+    :params quinphones: integer array of shape (phones, 5) with the numerical values of the quin-phones
+    :params numeric_contexts: array of shape (phones, len(NUMERIC_FIELDS))
+    :params categorical_contexts: integer array of shape (phones, len(CATEGORICAL_FIELDS))
+    :params num_phones: number of different phones
+    :params num_categories: list with the number of different values of every categorical field
+    :params sparse: whether to return a sparse CSR matrix or a dense array
+    :returns: matrix of shape (phones, number of features)
+    """
+    num_rows = quinphones.shape[0]
+    sizes = [num_phones] * quinphones.shape[1] + list(num_categories)
+    codes = np.hstack((quinphones, categorical_contexts)).astype(np.int64)
+
+    # every coded column is shifted to its own block of columns
+    column_offsets = np.zeros(len(sizes), dtype=np.int64)
+    column_offsets[1:] = np.cumsum(sizes)[:-1]
+    column_offsets[quinphones.shape[1]:] += numeric_contexts.shape[1]
+    num_features = sum(sizes) + numeric_contexts.shape[1]
+    numeric_offset = num_phones * quinphones.shape[1]
+
+    rows, columns = np.nonzero(codes >= 0)
+    one_hot_columns = column_offsets[columns] + codes[rows, columns]
+
+    numeric = np.array(numeric_contexts, dtype=np.float32)
+    numeric[np.isnan(numeric)] = -1
+
+    if sparse:
+        numeric_rows, numeric_columns = np.nonzero(numeric)
+        data = np.concatenate((np.ones(len(rows), dtype=np.float32), numeric[numeric_rows, numeric_columns]))
+        rows = np.concatenate((rows, numeric_rows))
+        columns = np.concatenate((one_hot_columns, numeric_columns + numeric_offset))
+        return sp.csr_matrix((data, (rows, columns)), shape=(num_rows, num_features))
+
+    features = np.zeros((num_rows, num_features), dtype=np.float32)
+    features[rows, one_hot_columns] = 1
+    features[:,numeric_offset:numeric_offset+numeric.shape[1]] = numeric
+    return features
+
+
+def feature_names(phones, categories):
+    """Names the columns of the feature matrix.
+
+    :params phones: list of the phones in order of their numerical values
+    :params categories: directory with the list of values of every categorical field
+    :returns: list with the name of every column
+    """
+    names = ['{:s}={:s}'.format(position, p) for position in QUINPHONE_POSITIONS for p in phones]
+    names += list(NUMERIC_FIELDS)
+    names += ['{:s}={:s}'.format(field, v) for field in CATEGORICAL_FIELDS for v in categories[field]]
+    return names
+
+
+def encode_categories(categorical_contexts, categories):
+    """Converts the categorical context fields into integer codes.
+
+    :params categorical_contexts: object matrix of shape (phones, len(CATEGORICAL_FIELDS))
+    :params categories: directory with the list of values of every categorical field
+    :returns: integer array of the same shape, unknown or missing values are -1
+    """
+    codes = np.empty(categorical_contexts.shape, dtype=np.int32)
+    for j,field in enumerate(CATEGORICAL_FIELDS):
+        values = {v:i for i,v in enumerate(categories[field])}
+        codes[:,j] = [values.get(v, -1) for v in categorical_contexts[:,j]]
+    return codes
+
+
+def label_features(label, phone_values, categories, sparse=False):
+    """Builds the feature matrix of a label.
+
+    The phones and categorical values are coded with the given values, which
+    usually are the ones of the training corpus (see
+    CoefficientStore.phone_values and CoefficientStore.categories), values that
+    are not known are treated as missing.
+
+    :params label: an instance of the Label class
+    :params phone_values: directory with the numerical values of the phones
+    :params categories: directory with the list of values of every categorical field
+    :params sparse: whether to return a sparse CSR matrix or a dense array
+    :returns: matrix of shape (phones, number of features)
+    """
+    codes = np.array([phone_values.get(str(p), -1) for p in label.phone_names] + [-1], dtype=np.int32)
+    num_phones = len([k for k in phone_values.keys() if k != 'None'])
+    num_categories = [len(categories[field]) for field in CATEGORICAL_FIELDS]
+
+    return feature_matrix(codes[label.quinphone_codes], label.numeric_contexts,
+                          encode_categories(label.categorical_contexts, categories),
+                          num_phones, num_categories, sparse)
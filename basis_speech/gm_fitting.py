@@ -5,17 +5,101 @@
 """
 
 import os
-import pickle
+import time
+import zlib
 import numpy as np
+from collections import OrderedDict
 from sklearn.mixture import GaussianMixture
+from sklearn.decomposition import PCA
 
-from utils import split_training_test, create_bfcr, phone_to_num
-from config import TEST_FILES, LF0_DIR, MGCORD, NUM_BASES, GMM_SAVED, OUT_DIR
+from utils import split_training_test, create_bfcr_many, phone_to_num, parallel_map
+from corpus import coefficient_store
+from gmm_bank import GMMBank, BackoffIndex, gmm_sampling_parameters, encode_quinphones, draw_samples, save_gmm_bank
+from config import TEST_FILES, LF0_DIR, MGCORD, NUM_BASES, GMM_BANK, OUT_DIR, NUM_WORKERS
 from resynthesize import resynthesize
 from prediction import Prediction
 
 MIN_INSTANCES = 3
 
+def gmm_seed(key, seed=0):
+    """Computes the random seed of the GMM of a phone.
+
+    The seed only depends on the phone and the given seed, thus the results
+    of the training don't depend on the order in which the GMMs are fitted.
+
+    :params key: the numerical value(s) of the phone
+    :params seed: seed of the whole model
+    :returns: the seed for the GMM of the phone
+    """
+    return zlib.crc32(repr((seed, key)).encode('utf-8'))
+
+
+def fit_gmm(task):
+    """Fits a GMM for the coefficients of one phone.
+
+    This helper function is used by the worker processes of
+    hierachical_gaussian._train_hierarchy(). The GMM keeps its random state,
+    thus sampling from it is reproducible too. If a previously fitted GMM is
+    given, it is fitted again starting from its current parameters. Phones
+    with less instances than components get one component per instance.
+
+    :params task: tuple of the key of the phone, its coefficients, the seed, the covariance type, the number of components and the previous GMM or None
+    :returns: the key of the phone
+    :returns: the fitted GMM
+    """
+    key, coefficients, seed, covariance_type, n_components, gm = task
+    if gm is None:
+        gm = GaussianMixture(min(n_components, len(coefficients)), covariance_type=covariance_type,
+                             random_state=np.random.RandomState(seed))
+    else:
+        gm.warm_start = True
+    gm.fit(coefficients)
+    return key, gm
+
+
+def gaussian_mixture(weights, means, cholesky, covariance_type, seed=0):
+    """Creates a fitted GMM from its sampling parameters.
+
+    This helper function does the inverse of gmm_sampling_parameters(), the
+    covariances and precisions are computed from the Cholesky factors. It is
+    used to fit the GMMs of a bank again, starting from their parameters.
+
+    :params weights: the weights of the components
+    :params means: the means of the components
+    :params cholesky: the Cholesky factors (or standard deviations) of the covariances of the components
+    :params covariance_type: covariance type of the GMM
+    :params seed: seed of the random state of the GMM
+    :returns: a GaussianMixture
+    """
+    means = np.array(means, dtype=np.float64)
+    cholesky = np.array(cholesky, dtype=np.float64)
+
+    if covariance_type in ('full', 'tied'):
+        precisions_cholesky = np.linalg.inv(cholesky).transpose(0, 2, 1)
+        covariances = np.matmul(cholesky, cholesky.transpose(0, 2, 1))
+        precisions = np.matmul(precisions_cholesky, precisions_cholesky.transpose(0, 2, 1))
+        if covariance_type == 'tied':
+            precisions_cholesky, covariances, precisions = precisions_cholesky[0], covariances[0], precisions[0]
+    else:
+        if covariance_type == 'spherical':
+            cholesky = cholesky[:,0]
+        precisions_cholesky = 1 / cholesky
+        covariances = cholesky**2
+        precisions = precisions_cholesky**2
+
+    gm = GaussianMixture(len(weights), covariance_type=covariance_type, random_state=np.random.RandomState(seed))
+    gm.weights_ = np.array(weights, dtype=np.float64)
+    gm.means_ = means
+    gm.covariances_ = covariances
+    gm.precisions_cholesky_ = precisions_cholesky
+    gm.precisions_ = precisions
+    gm.converged_ = True
+    gm.n_iter_ = 0
+    gm.lower_bound_ = -np.inf
+    gm.n_features_in_ = means.shape[1]
+    return gm
+
+
 class hierachical_gaussian:
 
     """A gaussian mixture model with differernt layers.
@@ -25,19 +109,40 @@ class hierachical_gaussian:
     trained, it will use to look up, if there is a GMM for a given quin-phone,
     if not it will look if there is a GMM for a given tri-phone, if not it will
     just use a single phone to sample the coefficients for a phone.
+    The number of components and the type of the covariances of the GMMs are
+    configurable and the GMMs can be fitted on a PCA projection of the
+    coefficients of the whole corpus. Diagonal or spherical covariances and
+    the projection make the model smaller and faster to train. A trained
+    model can be updated with new data, then only the GMMs of the phones in the
+    new data are fitted again. Only the GMMs are saved (see export()), for
+    updating a model its training data is taken again from the coefficient
+    store of its training files (see load()).
 
     """
 
-    def __init__(self, X, y):
+    def __init__(self, X, y, covariance_type='full', n_dimensions=None, n_components=1, phone_values=None, projection=None):
         """Initialises the instance with for a given X and y.
 
         Creates all needed member variables and populates the directories
         representing the different types of phones (qui, tri or single). While
         populating it also converts the strings into a numerical values.
+        If a number of dimensions is given, the coefficients are projected on
+        that many principal components before. The projection is computed with
+        a full SVD, thus it is the same on every run. The numerical values of
+        the phones and the projection can also be given, e.g. the ones of a
+        previously trained model.
 
         :param X: quin-phones for training the model
         :param y: coefficients for the given phones
+        :param covariance_type: covariance type of the GMMs ('full', 'tied', 'diag' or 'spherical'), with one component 'tied' is the same as 'full'
+        :param n_dimensions: number of principal components, if None the coefficients are not projected
+        :param n_components: number of components of every GMM
+        :param phone_values: directory with the numerical values of the phones, if None they are computed from X
+        :param projection: tuple of the mean and the principal components to project on, if given n_dimensions is ignored
         """
+        self._covariance_type = covariance_type
+        self._n_components = n_components
+        self._projection = projection
         self._phone_values = set()
         self._single_phones = {}
         self._tri_phones = {}
@@ -45,135 +150,306 @@ class hierachical_gaussian:
         self._single_predictor = {}
         self._tri_predictor = {}
         self._quin_predictor = {}
+        self._sampling_parameters = {}
+        self._predictors = []
+        self._index = BackoffIndex(self._predictors)
+
+        if phone_values is None:
+            for p in X:
+                self._phone_values.add(p[2])
+            self._phone_values = phone_to_num(self._phone_values)
+        else:
+            self._phone_values = OrderedDict(phone_values)
 
-        for p in X:
-            self._phone_values.add(p[2])
-        self._phone_values = phone_to_num(self._phone_values)
+        # the phones are converted into numerical values once, then the coefficients are grouped by sorting
+        self._contexts = encode_quinphones(X, self._phone_values)
+        self._y = np.asarray(y)
 
-        for i,p in enumerate(X):
-            self._single_phones = self._add_to_dict(self._single_phones, p[2], y[i])
-            self._tri_phones = self._add_to_dict(self._tri_phones, p[1:3], y[i])
-            self._quin_phones = self._add_to_dict(self._quin_phones, p, y[i])
+        if projection is not None:
+            mean, components = projection
+            self._y = np.dot(self._y - mean, components.T)
+        elif n_dimensions is not None:
+            pca = PCA(n_dimensions, svd_solver='full')
+            self._y = pca.fit_transform(self._y)
+            self._projection = pca.mean_, pca.components_
 
-        # change the key to a numerical value and remove keys with too little instances
-        self._single_phones = {self._phone_values[key]:value for key,value in self._single_phones.items()}
-        self._tri_phones = {tuple([self._phone_values[str(k)] for k in key]):value for key,value in self._tri_phones.items() if len(value) > MIN_INSTANCES and value.ndim == 2}
-        self._quin_phones = {tuple([self._phone_values[str(k)] for k in key]):value for key,value in self._quin_phones.items() if len(value) > MIN_INSTANCES and value.ndim == 2}
+        self._build_groups()
 
-    def train(self):
+    def __getstate__(self):
+        """Leaves out the grouped coefficients and the cached sampling parameters when pickling.
+
+        :returns: the state of the instance
+        """
+        state = self.__dict__.copy()
+        for name in ('_single_phones', '_tri_phones', '_quin_phones'):
+            state[name] = {}
+        state['_sampling_parameters'] = {}
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled instance and groups its coefficients again.
+
+        :params state: the state of the instance
+        """
+        self.__dict__.update(state)
+        self._build_groups()
+
+    def train(self, workers=NUM_WORKERS, seed=0):
         """Trains the tree different layers of the model.
 
         This method trains the GMMs for every quin-, tri- or single-phone that
-        has been passed to the constructor
-        """
-        self._single_predictor = self._train_hierarchy(self._single_phones)
-        self._tri_predictor = self._train_hierarchy(self._tri_phones)
-        self._quin_predictor = self._train_hierarchy(self._quin_phones)
+        has been passed to the constructor. The GMMs are fitted in a pool of
+        processes, every GMM gets its own seed derived from the given seed and
+        its phone, thus the training is reproducible.
 
-    def sample(self, X):
+        :params workers: number of worker processes
+        :params seed: seed of the whole model
+        """
+        self._single_predictor = self._train_hierarchy(self._single_phones, 'single-phones', workers, seed)
+        self._tri_predictor = self._train_hierarchy(self._tri_phones, 'tri-phones', workers, seed)
+        self._quin_predictor = self._train_hierarchy(self._quin_phones, 'quin-phones', workers, seed)
+        self._build_index()
+
+    def update(self, X, y, workers=NUM_WORKERS, seed=0):
+        """Updates the trained model with new data.
+
+        The new instances are added to the training data. Only the GMMs of the
+        phones (or tri- or quin-phones) in the new data are fitted again,
+        starting from their current parameters. Tri- and quin-phones that have
+        more than MIN_INSTANCES instances now get new GMMs, so do new phones.
+        The PCA projection is not fitted again.
+
+        :param X: quin-phones of the new data
+        :param y: coefficients of the new data
+        :params workers: number of worker processes
+        :params seed: seed of the whole model
+        """
+        for p in X:
+            if str(p[2]) not in self._phone_values:
+                self._phone_values[str(p[2])] = max(self._phone_values.values()) + 1
+
+        contexts = encode_quinphones(X, self._phone_values)
+        y = np.asarray(y)
+        if self._projection is not None:
+            mean, components = self._projection
+            y = np.dot(y - mean, components.T)
+
+        self._contexts = np.vstack((self._contexts, contexts))
+        self._y = np.vstack((self._y, y))
+        self._build_groups()
+
+        changed_single = set(contexts[:,2].tolist())
+        changed_tri = set(map(tuple, contexts[:,1:3].tolist()))
+        changed_quin = set(map(tuple, contexts.tolist()))
+        self._single_predictor = self._train_hierarchy(self._single_phones, 'single-phones', workers, seed, self._single_predictor, changed_single)
+        self._tri_predictor = self._train_hierarchy(self._tri_phones, 'tri-phones', workers, seed, self._tri_predictor, changed_tri)
+        self._quin_predictor = self._train_hierarchy(self._quin_phones, 'quin-phones', workers, seed, self._quin_predictor, changed_quin)
+        self._build_index()
+
+    def sample(self, X, random_state=None):
         """Samples from the GMMs for a given input.
 
         This method checks if there is a model for a given input from the most
         specific one to the most general one. First it checkes if there is a
         model for the whole quin-phone, if not it checks if there is a model
         for the tri-phones, if still no model is found it samples the single
-        phone.
+        phone. The models of all phones are looked up at once in the back-off
+        index, then the phones are grouped by the chosen model and all samples
+        of one model are drawn at once.
 
         :param X: quin-phone for sapmling
-        :returns: the sampled phone coefficients
+        :param random_state: seed or instance of numpy.random.RandomState, if None the samples are not reproducible
+        :returns: the sampled phone coefficients, one row per phone
         """
-        coefficients = []
+        choices = self._index.choose(encode_quinphones(X, self._phone_values))
+        return draw_samples(self._predictors, choices, self._parameters, random_state, self._projection)
 
-        for x in X:
-            quin = tuple([self._phone_values[str(p)] for p in x])
-            tri = tuple([self._phone_values[str(p)] for p in x[1:3]])
-            single = self._phone_values[str(x[2])]
+    def export(self, directory, training_files=None):
+        """Exports the trained GMMs as a bank of arrays (see gmm_bank.GMMBank).
 
-            if quin in self._quin_predictor:
-                coefficients.append(self._quin_predictor[quin].sample())
-            elif tri in self._tri_predictor:
-                coefficients.append(self._tri_predictor[tri].sample())
-            else:
-                coefficients.append(self._single_predictor[single].sample())
+        If the training files are given, they are stored in the bank together
+        with the covariance type and the number of components, then the model
+        can be loaded again with load().
 
-        coefficients = [i[0] for i in coefficients]
-        coefficients = np.squeeze(np.array(coefficients))
-        return coefficients
+        :params directory: the directory where the bank is created
+        :params training_files: a list of the training files of the model or None
+        :returns: an instance of GMMBank
+        """
+        training = None
+        if training_files is not None:
+            training = {'files': list(training_files), 'covariance_type': self._covariance_type, 'n_components': self._n_components}
+        models = [(hierarchy, key, self._parameters((hierarchy, key))) for hierarchy,key in self._predictors]
+        return save_gmm_bank(directory, self._phone_values, models, self._projection, training)
+
+    @classmethod
+    def load(cls, directory=GMM_BANK, workers=NUM_WORKERS, seed=0):
+        """Loads a model from a bank which was exported with its training files.
+
+        The training data is taken from the coefficient store of the training
+        files and the GMMs are created from the parameters in the bank (see
+        gaussian_mixture()), thus the model can be updated again. The bank is
+        read into memory completely, thus it can be overwritten afterwards.
+
+        :params directory: the directory of the bank
+        :params workers: number of worker processes for encoding
+        :params seed: seed of the whole model
+        :returns: the model
+        :returns: the list of training files
+        :raises Exception: if the training files aren't stored in the bank
+        """
+        bank = GMMBank(directory, mmap_mode=None)
+        training = bank.training
+        if training is None:
+            raise Exception('The bank in {:s} has no training files'.format(directory))
+
+        store = coefficient_store(training['files'], workers=workers)
+        hgm = cls(store.quinphones(), store.phone_coefficients(), training['covariance_type'],
+                  n_components=training['n_components'], phone_values=bank.phone_values, projection=bank.projection)
+
+        predictors = {'quin':hgm._quin_predictor, 'tri':hgm._tri_predictor, 'single':hgm._single_predictor}
+        for hierarchy, key, parameters in bank.models():
+            predictors[hierarchy][key] = gaussian_mixture(*parameters, training['covariance_type'], gmm_seed(key, seed))
+        hgm._build_index()
+        return hgm, training['files']
+
+    def _parameters(self, predictor):
+        """Gets the sampling parameters of a GMM, they are cached after the first call.
+
+        :param predictor: tuple of the hierarchy ('quin', 'tri' or 'single') and the key of the GMM
+        :returns: the weights, means and Cholesky factors of the GMM (see gmm_sampling_parameters())
+        """
+        if predictor not in self._sampling_parameters:
+            hierarchy, key = predictor
+            gm = {'quin':self._quin_predictor, 'tri':self._tri_predictor, 'single':self._single_predictor}[hierarchy][key]
+            self._sampling_parameters[predictor] = gmm_sampling_parameters(gm)
+        return self._sampling_parameters[predictor]
 
-    def _train_hierarchy(self, hierarchy):
+    def _train_hierarchy(self, hierarchy, name, workers=NUM_WORKERS, seed=0, previous=None, changed=None):
         """Trains a hierarchy (quin-, tri- or single-phones).
 
-        This helper method fits a GMM for all phones of one hierarchy.
+        This helper method fits a GMM for all phones of one hierarchy in a pool
+        of processes and reports the progress every 10 percent. If previously
+        fitted GMMs are given, only the changed phones and the phones without a
+        GMM are fitted, the previous GMMs are used as initialisation.
 
         :param hierarchy: all phones of one hierarchy
+        :param name: name of the hierarchy used for reporting the progress
+        :param workers: number of worker processes
+        :param seed: seed of the whole model
+        :param previous: directory with the previously fitted GMMs or None
+        :param changed: set of the phones with new data, if None all phones are fitted
         :returns: fitted GMMs for the given hierarchy
         """
-        output = dict.fromkeys(hierarchy.keys())
-
-        for k in output.keys():
-            gm = GaussianMixture()
-            gm.fit(hierarchy[k])
+        if previous is None:
+            previous = {}
+        output = {k:previous.get(k) for k in hierarchy.keys()}
+        keys = [k for k in hierarchy.keys() if changed is None or k in changed or k not in previous]
+        tasks = [(k, hierarchy[k], gmm_seed(k, seed), self._covariance_type, self._n_components, previous.get(k)) for k in keys]
+        report_every = max(1, int(np.ceil(len(tasks) / 10)))
+        start = time.time()
+
+        for i,(k,gm) in enumerate(parallel_map(fit_gmm, tasks, workers, ordered=False, chunks_per_worker=16), 1):
             output[k] = gm
-            print('Fitted {:s}'.format(''.join(str(k))))
+            if i % report_every == 0 or i == len(tasks):
+                elapsed = time.time() - start
+                print('Fitted {:d}/{:d} GMMs for {:s} in {:.1f} s ({:.1f} GMMs/s)'.format(i, len(tasks), name, elapsed, i / max(elapsed, 1e-6)))
         return output
 
-    def _add_to_dict(self, directory, key, value):
-        """Adds a row of coefficients for given phones to a given directory.
+    def _build_groups(self):
+        """Groups the training data into single-, tri- and quin-phones."""
+        self._single_phones = self._group(self._contexts[:,2:3], self._y)
+        self._tri_phones = self._group(self._contexts[:,1:3], self._y, MIN_INSTANCES)
+        self._quin_phones = self._group(self._contexts, self._y, MIN_INSTANCES)
+
+    def _build_index(self):
+        """Builds the back-off index of the trained GMMs."""
+        self._sampling_parameters = {}
+        self._predictors = []
+        for hierarchy, predictor in (('quin', self._quin_predictor), ('tri', self._tri_predictor), ('single', self._single_predictor)):
+            self._predictors += [(hierarchy, key) for key in predictor.keys()]
+        self._index = BackoffIndex(self._predictors)
+
+    def _group(self, contexts, y, min_instances=None):
+        """Groups the coefficients by their phones.
+
+        This helper method sorts the phones once and takes the coefficients of
+        every phone (or tri- or quin-phone) as one contiguous slice of the
+        sorted coefficients, thus the time needed grows linearly with the
+        number of phones. Phones with too little instances are skipped.
+
+        :params contexts: numerical values of the phones, one row per instance
+        :params y: the coefficients, one row per instance
+        :params min_instances: minimum number of instances (exclusive), if None all phones are kept
+        :returns: directory with the phones as keys and the coefficients as values
+        """
+        if len(contexts) == 0:
+            return {}
 
-        This helper method creates a new numpy array in the given directory if
-        the given phone is not existing or stacks a row of coefficients to that
-        phone.
+        order = np.lexsort(contexts.T[::-1])
+        contexts = contexts[order]
+        y = y[order]
 
-        :params directory: the directory to add the coefficients
-        :params key: the phone to create or add in the directory
-        :params value: the coefficients to add
-        :returns: the given directory with the added new coefficients
-        """
-        if key in directory:
-            tmp = directory[key]
-            tmp = np.vstack((tmp, value))
-            directory[key] = tmp
-        else:
-            directory[key] = np.array(value)
-        return directory
+        borders = np.flatnonzero(np.any(contexts[1:] != contexts[:-1], axis=1)) + 1
+        begins = np.concatenate(([0], borders))
+        ends = np.concatenate((borders, [len(contexts)]))
 
-def train_gmm(training_files):
+        groups = {}
+        for begin, end in zip(begins, ends):
+            if min_instances is None or end - begin > min_instances:
+                key = tuple(contexts[begin].tolist())
+                groups[key if len(key) > 1 else key[0]] = y[begin:end]
+        return groups
+
+def train_gmm(training_files, workers=NUM_WORKERS, covariance_type='full', n_dimensions=None, n_components=1):
     """Trains a hierachical gaussian model.
 
     This function trains a hierarchical gaussian model for the given training
-    files. Before the training it creates a BFCR instace for all training files
-    and collects all the different phones in the test data. Once the training
-    is done it saves them as a binary file.
+    files. The coefficients and quin-phones of the training files are taken
+    from the coefficient store of the training files, which is built if it
+    doesn't exist yet. Once the training is done it exports the GMMs as a bank
+    of arrays (see gmm_bank.GMMBank) together with the training files, which
+    are needed for updating it with update_gmm().
 
     :params training_files: a list of training files for the model
+    :params workers: number of worker processes for encoding and training
+    :params covariance_type: covariance type of the GMMs (see hierachical_gaussian)
+    :params n_dimensions: number of principal components, if None the coefficients are not projected
+    :params n_components: number of components of every GMM
     :returns: a trained hierarchical gaussian model
     """
-    BFCR_training = []
-    X = []
-    y = []
+    store = coefficient_store(training_files, workers=workers)
+    X = store.quinphones()
+    y = store.phone_coefficients()
 
-    phone_values = set()
+    hgm = hierachical_gaussian(X, y, covariance_type, n_dimensions, n_components)
+    hgm.train(workers)
 
-    for training_file in training_files:
-        bfcr = create_bfcr(training_file)
-        BFCR_training.append(bfcr)
+    hgm.export(GMM_BANK, training_files)
+    print('Saved trained GMM')
 
-        coefficients = bfcr.phone_coefficients('mgc')
+    return hgm
 
-        for i, p in enumerate(bfcr.label.cur_phones()):
-            phone_values.add(p)
 
-            X.append(tuple(bfcr.label.phones[i].quinphone))
-            y.append(coefficients[i,:])
+def update_gmm(new_files, workers=NUM_WORKERS):
+    """Updates the saved hierachical gaussian model with new files.
 
-    phone_values = phone_to_num(phone_values)
+    This function loads the model exported by train_gmm() (see
+    hierachical_gaussian.load()) and updates it with the coefficients and
+    quin-phones of the new files (see hierachical_gaussian.update()), thus
+    only the GMMs of phones in the new files are fitted again. Afterwards the
+    bank is exported again, with the new files added to the training files.
 
-    hgm = hierachical_gaussian(X,y)
-    hgm.train()
+    :params new_files: a list of files to add to the model
+    :params workers: number of worker processes for encoding and training
+    :returns: the updated hierarchical gaussian model
+    """
+    hgm, training_files = hierachical_gaussian.load(GMM_BANK, workers)
 
-    with open(GMM_SAVED, 'wb') as f:
-        pickle.dump(hgm, f)
-        print('Saved trained GMM')
+    store = coefficient_store(new_files, workers=workers)
+    hgm.update(store.quinphones(), store.phone_coefficients(), workers)
+
+    hgm.export(GMM_BANK, training_files + store.files)
+    print('Saved updated GMM')
 
     return hgm
 
@@ -188,22 +464,20 @@ def predict_gmm(hgm, test_files, output_dir=None, create_original=True):
     By default a *.wav file of the orginal is created and the default path is
     ./wavs/gmm.
 
-    :params hgm: the hierarchical gaussian model to use
+    :params hgm: the hierarchical gaussian model or GMMBank to use
     :params test_files: a list of test files
     :params output_dir: directory where the *.wav files are created
     :params create_original: wether to create an *.wav of the orginal or not
     :returns: list of predictions with results from the GMM
     """
-    BFCR_test = []
     MODEL = 'GMM'
 
     if output_dir is None:
         output_dir = 'wavs/gmm/'
 
-    for test_file in test_files:
-        bfcr = create_bfcr(test_file)
-        BFCR_test.append(bfcr)
+    BFCR_test = create_bfcr_many(test_files)
 
+    for test_file, bfcr in zip(test_files, BFCR_test):
         if create_original:
             original_mgc = bfcr.original_matrix('mgc')
             lf0_filename = LF0_DIR + test_file + '.lf0'
@@ -212,11 +486,7 @@ def predict_gmm(hgm, test_files, output_dir=None, create_original=True):
     predictions = [Prediction(os.path.splitext(os.path.basename(bfcr.label_file))[0]) for bfcr in BFCR_test]
 
     for i,bfcr in enumerate(BFCR_test):
-        X = []
-        for j,_ in enumerate(bfcr.label.cur_phones()):
-            X.append(bfcr.label.phones[j].quinphone)
-
-        y = hgm.sample(X)
+        y = hgm.sample(bfcr.label.quinphones)
 
         bfcr.encoded_features = {'mgc':np.reshape(y, (y.shape[0], MGCORD+1, NUM_BASES))}
         predicted_mgc = bfcr.decode_feature('mgc')
@@ -237,12 +507,11 @@ if __name__ == '__main__':
     # model for creating *.wav files and plots, also computes the mean of
     # the MSE values of 25 different runs
     PREFIX = 'gmm_'
-    if not os.path.exists(GMM_SAVED):
+    if not os.path.exists(GMM_BANK):
         training_files, test_files = split_training_test(PREFIX)
         hgm = train_gmm(training_files)
     else:
-        with open(GMM_SAVED, 'rb') as f:
-            hgm = pickle.load(f)
+        hgm = GMMBank(GMM_BANK)
 
     with open(PREFIX + TEST_FILES, 'r') as f:
         test_files = f.readlines()
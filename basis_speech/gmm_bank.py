@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Franz Papst
+"""
+
+import os
+import json
+import numpy as np
+
+# number of bits of one phone in the packed keys of the back-off index
+PHONE_BITS = 12
+
+def gmm_sampling_parameters(gm):
+    """Extracts the parameters needed for sampling from a fitted GMM.
+
+    The covariances of full and tied GMMs are converted into Cholesky factors
+    of shape (components, dimensions, dimensions). Diagonal and spherical
+    covariances are converted into standard deviations of shape (components,
+    dimensions), the diagonal of their Cholesky factors. The weights are
+    normalised again as float64, because sklearn keeps them as float32 for
+    float32 coefficients and then they don't sum up to one exactly enough for
+    sampling.
+
+    :params gm: a fitted GaussianMixture
+    :returns: the weights of the components
+    :returns: the means of the components, shape (components, dimensions)
+    :returns: the Cholesky factors of the covariances
+    """
+    n_components, n_dimensions = gm.means_.shape
+
+    if gm.covariance_type == 'full':
+        cholesky = np.linalg.cholesky(gm.covariances_)
+    elif gm.covariance_type == 'tied':
+        cholesky = np.repeat(np.linalg.cholesky(gm.covariances_)[np.newaxis], n_components, axis=0)
+    elif gm.covariance_type == 'diag':
+        cholesky = np.sqrt(gm.covariances_)
+    else:
+        cholesky = np.repeat(np.sqrt(gm.covariances_)[:,np.newaxis], n_dimensions, axis=1)
+
+    weights = np.asarray(gm.weights_, dtype=np.float64)
+    return weights / weights.sum(), gm.means_, cholesky
+
+
+def sample_gmm(weights, means, cholesky, n_samples, random_state):
+    """Draws samples from a GMM given by its parameters.
+
+    :params weights: the weights of the components
+    :params means: the means of the components
+    :params cholesky: the Cholesky factors (or standard deviations) of the covariances of the components
+    :params n_samples: number of samples to draw
+    :params random_state: an instance of numpy.random.RandomState
+    :returns: the samples, shape (n_samples, dimensions)
+    """
+    components = random_state.choice(len(weights), size=n_samples, p=weights)
+    noise = random_state.standard_normal((n_samples, means.shape[1]))
+    if cholesky.ndim == 2:
+        return means[components] + cholesky[components] * noise
+    return means[components] + np.einsum('nij,nj->ni', cholesky[components], noise)
+
+
+def encode_quinphones(X, phone_values):
+    """Converts quin-phones into their numerical values.
+
+    Only the distinct phones are looked up in the directory, all phones are
+    just numbered in order of appearance.
+
+    :params X: quin-phones of the phones
+    :params phone_values: directory with the numerical values of the phones
+    :returns: integer array of shape (phones, 5)
+    """
+    names = {}
+    codes = np.fromiter((names.setdefault(p, len(names)) for x in X for p in x), dtype=np.int64, count=5*len(X))
+    values = np.array([phone_values[str(name)] for name in names.keys()], dtype=np.int64)
+    return values[codes].reshape(-1, 5)
+
+
+def pack_contexts(contexts):
+    """Packs the numerical values of a quin-, tri- or single-phone into one integer.
+
+    Every phone takes PHONE_BITS bits, the number of phones is stored in the
+    highest bits, thus quin-, tri- and single-phones never get the same key.
+
+    :params contexts: integer array of shape (phones, 1, 2 or 5)
+    :returns: int64 array with one key per row
+    """
+    contexts = np.asarray(contexts, dtype=np.int64) + 1
+    if contexts.size and (contexts.min() < 0 or contexts.max() >= 1 << PHONE_BITS):
+        raise Exception('Numerical phone values must be between -1 and {:d}'.format((1 << PHONE_BITS) - 2))
+
+    keys = np.full(contexts.shape[0], contexts.shape[1], dtype=np.int64) << (5 * PHONE_BITS)
+    for i in range(contexts.shape[1]):
+        keys |= contexts[:,i] << (i * PHONE_BITS)
+    return keys
+
+
+class BackoffIndex:
+
+    """An index of the GMMs of a hierarchical gaussian model.
+
+    This class packs the key of every GMM into one integer (see
+    pack_contexts()) and keeps them sorted, thus the GMMs of all phones of an
+    utterance are found with one binary search per hierarchy instead of a
+    directory lookup per phone.
+
+    """
+
+    def __init__(self, predictors):
+        """Initialises the index for the given GMMs.
+
+        :params predictors: list of the GMMs as tuples of the hierarchy and the key
+        """
+        keys = [pack_contexts(np.reshape(key, (1, -1)))[0] for _,key in predictors]
+        keys = np.array(keys, dtype=np.int64)
+        self._order = np.argsort(keys)
+        self._keys = keys[self._order]
+
+    def choose(self, contexts):
+        """Chooses the GMM of every phone.
+
+        For every phone the most specific GMM is chosen: the one of its
+        quin-phone if it exists, else the one of its tri-phone, else the one of
+        its single phone.
+
+        :params contexts: numerical values of the quin-phones, shape (phones, 5)
+        :returns: array with the index of the chosen GMM for every phone
+        :raises Exception: if there is no GMM for the single phone of a phone
+        """
+        choices, found = self._find(contexts[:,2:3])
+        if not found.all():
+            raise Exception('No GMM for phone {:d}'.format(int(contexts[np.argmin(found),2])))
+
+        for hierarchy in (contexts[:,1:3], contexts):
+            indices, found = self._find(hierarchy)
+            choices[found] = indices[found]
+        return choices
+
+    def _find(self, contexts):
+        """Looks up the GMMs of the given phones.
+
+        :params contexts: numerical values of the phones
+        :returns: array with the index of the GMM for every phone
+        :returns: boolean array, whether there is a GMM for a phone
+        """
+        keys = pack_contexts(contexts)
+        if len(self._keys) == 0:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return self._order[positions], self._keys[positions] == keys
+
+
+def draw_samples(predictors, choices, parameters, random_state=None, projection=None):
+    """Draws one sample for every phone from its chosen GMM.
+
+    The phones are grouped by their GMM and all samples of one GMM are drawn
+    at once. If the GMMs were fitted on a PCA projection of the coefficients,
+    the samples are projected back.
+
+    :params predictors: list of the GMMs as tuples of the hierarchy and the key
+    :params choices: array with the index of the chosen GMM for every phone
+    :params parameters: function returning the sampling parameters of a GMM (see gmm_sampling_parameters())
+    :params random_state: seed or instance of numpy.random.RandomState, if None the samples are not reproducible
+    :params projection: tuple of the mean and the principal components of the PCA or None
+    :returns: the samples in the order of the phones, one row per phone
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    samples = None
+    order = np.argsort(choices, kind='mergesort')
+    borders = np.flatnonzero(np.diff(choices[order])) + 1
+
+    for rows in np.split(order, borders):
+        if len(rows) == 0:
+            continue
+        drawn = sample_gmm(*parameters(predictors[choices[rows[0]]]), len(rows), random_state)
+        if samples is None:
+            samples = np.empty((len(choices), drawn.shape[1]))
+        samples[rows] = drawn
+
+    if projection is not None:
+        mean, components = projection
+        samples = np.dot(samples, components) + mean
+    return samples
+
+
+class GMMBank:
+
+    """The GMMs of a hierarchical gaussian model as plain arrays.
+
+    This class holds the weights, means and Cholesky factors of the
+    covariances of all GMMs of a trained hierachical_gaussian, stacked in
+    contiguous arrays which are memory-mapped from disk. An index gives the
+    components of every GMM. If the GMMs were fitted on a PCA projection of
+    the coefficients, the projection is stored as well. Sampling works like
+    hierachical_gaussian.sample() but doesn't need sklearn. A bank is created
+    with the function save_gmm_bank() or hierachical_gaussian.export(), if the
+    training files are stored too, the model can be loaded again for updating
+    it (see hierachical_gaussian.load()).
+
+    """
+
+    def __init__(self, directory, mmap_mode='r'):
+        """Opens a bank in the given directory.
+
+        :params directory: the directory of the bank
+        :params mmap_mode: memory-map mode of the arrays, if None they are loaded into memory
+        """
+        with open(os.path.join(directory, 'index.json'), 'r') as f:
+            index = json.load(f)
+
+        self._phone_values = index['phone_values']
+        self._predictors = [(hierarchy, tuple(key) if isinstance(key, list) else key) for hierarchy,key in index['models']]
+        self._rows = {predictor:i for i,predictor in enumerate(self._predictors)}
+        self._index = BackoffIndex(self._predictors)
+
+        self._offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        self._weights = np.load(os.path.join(directory, 'weights.npy'))
+        self._means = np.load(os.path.join(directory, 'means.npy'), mmap_mode=mmap_mode)
+        self._cholesky = np.load(os.path.join(directory, 'cholesky.npy'), mmap_mode=mmap_mode)
+
+        self._training = index.get('training')
+        self._projection = None
+        if index['projection']:
+            self._projection = np.load(os.path.join(directory, 'projection_mean.npy')), np.load(os.path.join(directory, 'projection.npy'))
+
+    def sample(self, X, random_state=None):
+        """Samples from the GMMs for a given input.
+
+        :param X: quin-phone for sapmling
+        :param random_state: seed or instance of numpy.random.RandomState, if None the samples are not reproducible
+        :returns: the sampled phone coefficients, one row per phone
+        """
+        choices = self._index.choose(encode_quinphones(X, self._phone_values))
+        return draw_samples(self._predictors, choices, self._parameters, random_state, self._projection)
+
+    @property
+    def phone_values(self):
+        """Getter for the directory containing the numerical values of phones."""
+        return self._phone_values
+
+    @property
+    def num_models(self):
+        """Getter for the number of GMMs in the bank."""
+        return len(self._rows)
+
+    @property
+    def projection(self):
+        """Getter for the mean and the principal components of the PCA or None."""
+        return self._projection
+
+    @property
+    def training(self):
+        """Getter for the training files and settings of the GMMs or None if they weren't stored."""
+        return self._training
+
+    def models(self):
+        """Iterates over all GMMs of the bank.
+
+        :returns: tuples of the hierarchy, the key and the sampling parameters of every GMM
+        """
+        for predictor in self._predictors:
+            yield predictor[0], predictor[1], self._parameters(predictor)
+
+    def _parameters(self, predictor):
+        """Gets the sampling parameters of a GMM.
+
+        :param predictor: tuple of the hierarchy ('quin', 'tri' or 'single') and the key of the GMM
+        :returns: the weights, means and Cholesky factors of the GMM
+        """
+        row = self._rows[predictor]
+        components = slice(self._offsets[row], self._offsets[row+1])
+        return self._weights[components], self._means[components], self._cholesky[components]
+
+
+def save_gmm_bank(directory, phone_values, models, projection=None, training=None):
+    """Saves GMMs as a new bank.
+
+    The weights are stored as float64, because they have to sum up to one
+    exactly enough for sampling, the means and Cholesky factors as float32.
+    All GMMs need to have the same type of covariance.
+
+    :params directory: the directory where the bank is created
+    :params phone_values: directory with the numerical values of the phones
+    :params models: list of tuples of the hierarchy, the key and the sampling parameters of a GMM
+    :params projection: tuple of the mean and the principal components of the PCA or None
+    :params training: directory with the training files, the covariance type and the number of components or None
+    :returns: an instance of GMMBank
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    offsets = np.zeros(len(models)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(weights) for _,_,(weights,_,_) in models])
+    total_components = int(offsets[-1])
+    n_dimensions = models[0][2][1].shape[1]
+    cholesky_shape = models[0][2][2].shape[1:]
+
+    weights = np.empty(total_components, dtype=np.float64)
+    means = np.lib.format.open_memmap(os.path.join(directory, 'means.npy'), mode='w+', dtype=np.float32, shape=(total_components, n_dimensions))
+    cholesky = np.lib.format.open_memmap(os.path.join(directory, 'cholesky.npy'), mode='w+', dtype=np.float32, shape=(total_components,) + cholesky_shape)
+
+    for i,(_,_,parameters) in enumerate(models):
+        components = slice(offsets[i], offsets[i+1])
+        weights[components], means[components], cholesky[components] = parameters
+
+    for array in (means, cholesky):
+        array.flush()
+    del means, cholesky
+    np.save(os.path.join(directory, 'offsets.npy'), offsets)
+    np.save(os.path.join(directory, 'weights.npy'), weights)
+    if projection is not None:
+        np.save(os.path.join(directory, 'projection_mean.npy'), projection[0])
+        np.save(os.path.join(directory, 'projection.npy'), projection[1])
+
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump({'phone_values': phone_values, 'models': [[hierarchy, key] for hierarchy,key,_ in models],
+                   'projection': projection is not None, 'training': training}, f)
+
+    return GMMBank(directory)
@@ -4,7 +4,9 @@
 @author: Franz Papst
 """
 
-from phone import Phone
+import numpy as np
+
+from phone import Phone, NUMERIC_FIELDS, CATEGORICAL_FIELDS
 
 class Label:
 
@@ -12,21 +14,71 @@ class Label:
 
     This class loads a label fire and parses it. Furthermore it provides easy
     access to phone related information like the start or end time of a phone.
+    Besides the list of phones it holds a columnar view of the label: arrays
+    with the start and end times and the numerical quin-phones of all phones,
+    as well as matrices of the numerical and the categorical context fields.
 
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, lazy=True):
         """Initialises the instance with a given lable file.
 
         This method loads the given label file and populates the list of phones,
-        which are parsed using the Phone class.
+        which are parsed using the Phone class. By default the context blocks
+        of the phones are only parsed when they are accessed.
 
         :params filename: label file to be loaded
+        :params lazy: whether to parse the context blocks of the phones lazily
         """
         self.phones = []
+        self.phone_names = []
+        phone_codes = {None:-1}
+        begins = []
+        ends = []
+        quinphones = []
+
         with open(filename, 'r') as f:
             for idx,l in enumerate(f.readlines()):
-                self.phones.append(Phone(l,idx))
+                phone = Phone(l,idx,lazy)
+                self.phones.append(phone)
+
+                begins.append(phone.begin)
+                ends.append(phone.end)
+                for p in phone.quinphone:
+                    if p not in phone_codes:
+                        phone_codes[p] = len(self.phone_names)
+                        self.phone_names.append(p)
+                quinphones.append([phone_codes[p] for p in phone.quinphone])
+
+        self.begins = np.array(begins, dtype=np.float64)
+        self.ends = np.array(ends, dtype=np.float64)
+        self.quinphone_codes = np.array(quinphones, dtype=np.int32).reshape(-1, 5)
+        self._numeric_contexts = None
+        self._categorical_contexts = None
+
+    @classmethod
+    def from_columns(cls, begins, ends, phone_names, quinphone_codes):
+        """Creates a label from its columnar view without parsing a label file.
+
+        Such a label has no Phone instances, thus only the times and the
+        quin-phones of the phones are available, the context fields are not.
+        It is used for labels which were already parsed in another process.
+
+        :params begins: array with the start times of the phones
+        :params ends: array with the end times of the phones
+        :params phone_names: list of the phones, indexed by the quin-phone codes
+        :params quinphone_codes: integer array of shape (phones, 5), missing phones are -1
+        :returns: an instance of Label
+        """
+        label = cls.__new__(cls)
+        label.phones = []
+        label.phone_names = list(phone_names)
+        label.begins = np.asarray(begins, dtype=np.float64)
+        label.ends = np.asarray(ends, dtype=np.float64)
+        label.quinphone_codes = np.asarray(quinphone_codes, dtype=np.int32).reshape(-1, 5)
+        label._numeric_contexts = None
+        label._categorical_contexts = None
+        return label
 
     def cur_phones(self):
         """This method iterates over all current phones.
@@ -38,8 +90,9 @@ class Label:
 
         :returns: the current phone
         """
-        for l in self.phones:
-            yield l.p3
+        names = self.phone_names + [None]
+        for code in self.quinphone_codes[:,2]:
+            yield names[code]
 
     def cur_phones_additions(self):
         """Iterates over all phones and returns the current phone with additional information
@@ -55,13 +108,73 @@ class Label:
         for l in self.phones:
             yield l.p3, l.begin, l.end, l.original_line
 
+    def phone_frames(self, step_size):
+        """Computes the first and last frame of every phone.
+
+        :params step_size: number of frames per second
+        :returns: array of shape (phones, 2) with the begin and end index of every phone
+        """
+        frames = np.empty((len(self.begins), 2), dtype=np.int64)
+        frames[:,0] = np.round(self.begins*step_size)
+        frames[:,1] = np.round(self.ends*step_size)
+        return frames
+
+    @property
+    def numeric_contexts(self):
+        """Getter for the numerical context fields of all phones.
+
+        The matrix has one column for every numerical field of the label
+        format (given by phone.NUMERIC_FIELDS), boolean values are 0 or 1 and
+        missing values are NaN. It is built on first access.
+
+        :returns: matrix of shape (phones, number of numerical fields)
+        """
+        if self._numeric_contexts is None:
+            self._parse_contexts()
+        return self._numeric_contexts
+
+    @property
+    def categorical_contexts(self):
+        """Getter for the categorical context fields of all phones.
+
+        The matrix has one column for every categorical field of the label
+        format (given by phone.CATEGORICAL_FIELDS) like the gpos or the ToBI
+        endtone, missing values are None. It is built on first access.
+
+        :returns: object matrix of shape (phones, number of categorical fields)
+        """
+        if self._categorical_contexts is None:
+            self._parse_contexts()
+        return self._categorical_contexts
+
+    @property
+    def quinphones(self):
+        """Getter for the quin-phones of all phones as strings.
+
+        :returns: object matrix of shape (phones, 5), missing phones are None
+        """
+        return np.array(self.phone_names + [None], dtype=object)[self.quinphone_codes]
+
+    def _parse_contexts(self):
+        """Collects the numerical and the categorical context fields of all phones in one pass.
+
+        :raises Exception: if the label was created from its columnar view
+        """
+        if len(self.phones) != len(self.begins):
+            raise Exception('The context fields of a label created from columns are not available')
+        fields = NUMERIC_FIELDS + CATEGORICAL_FIELDS
+        values = [[getattr(p, field) for field in fields] for p in self.phones]
+        values = np.array(values, dtype=object).reshape(-1, len(fields))
+        self._numeric_contexts = values[:,:len(NUMERIC_FIELDS)].astype(np.float64)
+        self._categorical_contexts = values[:,len(NUMERIC_FIELDS):]
+
     @property
     def first_phone_start(self):
         """Getter for the beginning time of the first phone.
 
         :returns: the beginning time of the first phone
         """
-        return self.phones[0].begin
+        return self.begins[0]
 
     @property
     def last_phone_end(self):
@@ -69,7 +182,7 @@ class Label:
 
         :returns: the end time of the last phone
         """
-        return self.phones[-1].end
+        return self.ends[-1]
 
     @property
     def num_phones(self):
@@ -77,4 +190,4 @@ class Label:
 
         :returns: the number of phones in the loaded label file
         """
-        return len(self.phones)
\ No newline at end of file
+        return len(self.begins)
\ No newline at end of file
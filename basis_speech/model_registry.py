@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Franz Papst
+"""
+
+import os
+import tempfile
+from collections import OrderedDict
+try:
+    import joblib
+except ImportError:
+    # older versions of sklearn ship joblib themselves
+    from sklearn.externals import joblib
+
+from config import MODEL_DIR, MODEL_MEMORY
+
+class ModelRegistry:
+
+    """A registry of trained models with a bounded memory budget.
+
+    This class keeps track of trained models which are saved on disk with
+    joblib. Models that were used recently stay in memory, once the models in
+    memory exceed the memory budget the least recently used ones are evicted.
+    Evicted models are loaded again with memory-mapped arrays, thus loading
+    them doesn't need to read the whole file. This doesn't help tree based
+    models like random forests: sklearn copies the node arrays of every tree
+    when unpickling it, thus a forest is always read into memory completely.
+    The size of a model is estimated by the size of its file. Only the
+    filenames are kept when the registry is pickled.
+
+    """
+
+    def __init__(self, directory=MODEL_DIR, max_size=MODEL_MEMORY):
+        """Initialises an empty registry.
+
+        By default the directory and the memory budget in bytes are the ones
+        stored in config.py.
+
+        :params directory: the directory where the models are saved
+        :params max_size: the memory budget in bytes
+        """
+        self._directory = directory
+        self._max_size = max_size
+        self._filenames = OrderedDict()
+        self._resident = OrderedDict()
+
+    @classmethod
+    def new(cls, prefix='', directory=MODEL_DIR, max_size=MODEL_MEMORY):
+        """Creates an empty registry in a new subdirectory.
+
+        The subdirectory is created in the given directory, its name starts
+        with the prefix and is unique (see tempfile.mkdtemp()), thus the models
+        of different registries never overwrite each other.
+
+        :params prefix: prefix of the name of the subdirectory
+        :params directory: the directory where the subdirectory is created
+        :params max_size: the memory budget in bytes
+        :returns: an instance of ModelRegistry
+        """
+        os.makedirs(directory, exist_ok=True)
+        return cls(tempfile.mkdtemp(prefix=prefix, dir=directory), max_size)
+
+    def __getstate__(self):
+        """Leaves out the models in memory when pickling.
+
+        :returns: the state of the registry
+        """
+        state = self.__dict__.copy()
+        state['_resident'] = OrderedDict()
+        return state
+
+    def __contains__(self, name):
+        """Checks if a model is in the registry.
+
+        :params name: name of the model
+        :returns: True if the model is in the registry
+        """
+        return name in self._filenames
+
+    def keys(self):
+        """Getter for the names of the models in the registry.
+
+        :returns: the names of the models in the order they were added
+        """
+        return self._filenames.keys()
+
+    def filename(self, name):
+        """Computes the filename of a model.
+
+        :params name: name of the model
+        :returns: the filename of the model
+        """
+        return os.path.join(self._directory, name.replace(' ', '_') + '.joblib')
+
+    def save(self, name, model):
+        """Saves a model and adds it to the registry.
+
+        :params name: name of the model
+        :params model: the model to save
+        """
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory, exist_ok=True)
+        joblib.dump(model, self.filename(name))
+        self.add(name, self.filename(name))
+
+    def add(self, name, filename):
+        """Adds a model which is already saved to the registry.
+
+        :params name: name of the model
+        :params filename: the file of the model
+        """
+        self._filenames[name] = filename
+        self._resident.pop(name, None)
+
+    def get(self, name):
+        """Gets a model, loading it if it is not in memory.
+
+        :params name: name of the model
+        :returns: the model
+        :raises KeyError: if the model is not in the registry
+        :raises FileNotFoundError: if the file of the model is missing
+        """
+        if name in self._resident:
+            self._resident.move_to_end(name)
+            return self._resident[name][0]
+
+        filename = self._filenames[name]
+        model = joblib.load(filename, mmap_mode='r')
+        self._resident[name] = (model, os.path.getsize(filename))
+        self._evict()
+        return model
+
+    def _evict(self):
+        """Removes the least recently used models until the models in memory fit the budget.
+
+        The most recently used model is never removed.
+        """
+        size = sum(s for _,s in self._resident.values())
+        while size > self._max_size and len(self._resident) > 1:
+            _, (_, model_size) = self._resident.popitem(last=False)
+            size -= model_size
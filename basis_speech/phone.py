@@ -5,311 +5,328 @@
 """
 
 import re
+from collections import OrderedDict
 
-class Phone:
+def char2bool(char):
+    """Converts a character to a boolean value
 
-    """A phone as defined in the HTS label format
+    This helper function converts a given character into a boolean value or
+    returns None if the value is not existing (marked as 'x').
 
-    This class parses one line (=one phone) of the HTS label format.
+    :params char: character to convert
+    :returns: boolean value of that character
     """
+    if char != 'x':
+        return bool(int(char))
+    else:
+        return None
 
-    def __init__(self, line, number_of_phone=None):
-        """Initialises the instance with one line of the label file.
 
-        :params line: the line to parse
-        :params number_of_phones: number of the phone in the lable file
-        """
-        self.original_line = line
-        if number_of_phone:
-            self.number = number_of_phone
-        else:
-            self.number = None
-
-        regex = re.compile(r'^ *(\d+) +(\d+)(.*)$')
-        m = regex.match(line)
+def str2int(string):
+    """Converts a string to an integer value
 
-        if m:
-            self.begin = int(m.group(1)) / 1e7
-            self.end = int(m.group(2)) / 1e7
-            rest = m.group(3).strip().split('/')
-            self.__split_P(rest[0])
-            self.__split_A(rest[1])
-            self.__split_B(rest[2])
-            self.__split_C(rest[3])
-            self.__split_D(rest[4])
-            self.__split_E(rest[5])
-            self.__split_F(rest[6])
-            self.__split_G(rest[7])
-            self.__split_H(rest[8])
-            self.__split_I(rest[9])
-            self.__split_J(rest[10])
-
-            self.p1_help = 'the phoneme identity before the previous phoneme'
-            self.p2_help = 'the previous phoneme identity'
-            self.p3_help = 'the current phoneme identity'
-            self.p4_help = 'the next phoneme identity'
-            self.p5_help = 'the phoneme after the next phoneme identity'
-            self.p6_help = 'position of the current phoneme identity in the current syllable (forward)'
-            self.p7_help = 'position of the current phoneme identity in the current syllable (backward)'
-            self.a1_help = 'whether the previous syllable stressed or not'
-            self.a2_help = 'whether the previous syllable accented or not'
-            self.a3_help = 'the number of phonemes in the previous syllable'
-            self.b1_help = 'whether the current syllable stressed or not'
-            self.b2_help = 'whether the current syllable accented or not'
-            self.b3_help = 'the number of phonemes in the current syllable'
-            self.b4_help = 'position of the current syllable in the current word (forward)'
-            self.b5_help = 'position of the current syllable in the current word (backward)'
-            self.b6_help = 'position of the current syllable in the current phrase (forward)'
-            self.b7_help = 'position of the current syllable in the current phrase (backward)'
-            self.b8_help = 'the number of stressed syllables before the current syllable in the current phrase'
-            self.b9_help = 'the number of stressed syllables after the current syllable in the current phrase'
-            self.b10_help = 'the number of accented syllables before the current syllable in the current phrase'
-            self.b11_help = 'the number of accented syllables after the current syllable in the current phrase'
-            self.b12_help = 'the distance per syllable from the previous stressed syllable to the current syllable'
-            self.b13_help = 'the distance per syllable from the current syllable to the next stressed syllable'
-            self.b14_help = 'the distance per syllable from the previous accented syllable to the current syllable'
-            self.b15_help = 'the distance per syllable from the current syllable to the next accented syllable'
-            self.b16_help = 'name of the vowel of the current syllable'
-            self.c1_help = 'whether the next syllable stressed or not'
-            self.c2_help = 'whether the next syllable accented or not'
-            self.c3_help = 'the number of phonemes in the next syllable'
-            self.d1_help = 'gpos (guess part-of-speech) of the previous word'
-            self.d2_help = 'the number of syllables in the previous word'
-            self.e1_help = 'gpos (guess part-of-speech) of the current word'
-            self.e2_help = 'the number of syllables in the current word'
-            self.e3_help = 'position of the current word in the current phrase (forward)'
-            self.e4_help = 'position of the current word in the current phrase (backward)'
-            self.e5_help = 'the number of content words before the current word in the current phrase'
-            self.e6_help = 'the number of content words after the current word in the current phrase'
-            self.e7_help = 'the distance per word from the previous content word to the current word'
-            self.e8_help = 'the distance per word from the current word to the next content word'
-            self.f1_help = 'gpos (guess part-of-speech) of the next word'
-            self.f2_help = 'the number of syllables in the next word'
-            self.g1_help = 'the number of syllables in the previous phrase'
-            self.g2_help = 'the number of words in the previous phrase'
-            self.h1_help = 'the number of syllables in the current phrase'
-            self.h2_help = 'the number of words in the current phrase'
-            self.h3_help = 'position of the current phrase in this utterance (forward)'
-            self.h4_help = 'position of the current phrase in this utterance (backward)'
-            self.h5_help = 'TOBI endtone of the current phrase'
-            self.i1_help = 'the number of syllables in the next phrase'
-            self.i2_help = 'the number of words in the next phrase'
-            self.j1_help = 'the number of syllables in this utterance'
-            self.j2_help = 'the number of words in this utterance'
-            self.j3_help = 'the number of phrases in this utterance'
-
-    def __split_P(self, string):
-        """Parses the current quin-phone.
-
-        :params string: string to parse
-        """
-        rest = string.split('^')
-        self._LL = self.__str2str(rest[0])
-        rest = rest[1].split('-')
-        self._L = self.__str2str(rest[0])
-        rest = rest[1].split('+')
-        self._C = self.__str2str(rest[0])
-        rest = rest[1].split('=')
-        self._R = self.__str2str(rest[0])
-        rest = rest[1].split('@')
-        self._RR = self.__str2str(rest[0])
-        rest = rest[1].split('_')
-        self._cur_phoneme_id_pos_forward = self.__str2int(rest[0])
-        self._cur_phoneme_id_pos_backward = self.__str2int(rest[1])
-
-    def __split_A(self, string):
-        """Parses information about the previous syllable.
-
-        :params string: string to parse
-        """
-        string = string[2:].split('_')
-        self._prev_syll_stressed = self.__char2bool(string[0])
-        self._prev_syll_accented = self.__char2bool(string[1])
-        self._prev_syll_phoneme_num = self.__str2int(string[2])
-
-    def __split_B(self, string):
-        """Parses information about the current syllable.
-
-        :params string: string to parse
-        """
-        string = string[2:].split('@')
-
-        b1_3 = string[0].split('-')
-        self._cur_syll_stressed = self.__char2bool(b1_3[0])
-        self._cur_syll_accented = self.__char2bool(b1_3[1])
-        self._cur_syll_phoneme_num = self.__str2int(b1_3[2])
-
-        string = string[1].split('&')
-        b4_5 = string[0].split('-')
-        self._cur_syll_pos_current_word_forward = self.__str2int(b4_5[0])
-        self._cur_syll_pos_current_word_backward = self.__str2int(b4_5[1])
-
-        string = string[1].split('#')
-        b6_7 = string[0].split('-')
-        self._cur_syll_pos_cur_phrase_forward = self.__str2int(b6_7[0])
-        self._cur_syll_pos_cur_phrase_backward = self.__str2int(b6_7[1])
-
-        string = string[1].split('$')
-        b8_9 = string[0].split('-')
-        self._cur_syll_num_stressed_sylls_before_cur_phrase = self.__str2int(b8_9[0])
-        self._cur_syll_num_stressed_sylls_after_cur_phrase = self.__str2int(b8_9[1])
-
-        string = string[1].split('!')
-        b10_11 = string[0].split('-')
-        self._cur_syll_num_accented_sylls_before_cur_phrase = self.__str2int(b10_11[0])
-        self._cur_syll_num_accented_sylls_after_cur_phrase = self.__str2int(b10_11[1])
-
-        string = string[1].split(';')
-        b12_13 = string[0].split('-')
-        self._cur_syll_distance_prev_stressed_syll = self.__str2int(b12_13[0])
-        self._cur_syll_distance_next_stressed_syll = self.__str2int(b12_13[1])
-
-        string = string[1].split('|')
-        b14_15 = string[0].split('-')
-        self._cur_syll_distance_prev_accented_syll = self.__str2int(b14_15[0])
-        self._cur_syll_distance_next_accented_syll = self.__str2int(b14_15[1])
-
-        self._cur_syll_vowel = self.__str2str(string[1])
-
-    def __split_C(self, string):
-        """Parses information about the next syllable.
-
-        :params string: string to parse
-        """
-        string = string[2:].split('+')
-        self._next_syll_stressed = self.__char2bool(string[0])
-        self._next_syll_accented = self.__char2bool(string[1])
-        self._next_syll_num_phonems = self.__str2int(string[2])
+    This helper function converts a given character into an integer value or
+    returns None if the value is not existing (marked as 'x').
 
-    def __split_D(self, string):
-        """Parses information about the guess part-of-speech of the previous word
+    :params string: string to convert
+    :returns: integer value of that string
+    """
+    if string != 'x':
+        return int(string)
+    else:
+        return None
 
-        :params string: string to parse
-        """
-        string = string[2:].split('_')
-        self._prev_word_gpos = self.__str2str(string[0])
-        self._prev_word_num_syll = self.__str2int(string[1])
 
-    def __split_E(self, string):
-        """Parses information about the guess part-of-speech of the current word
+def str2str(string):
+    """Checks if the given string is valid
 
-        :params string: string to parse
-        """
-        string = string[2:].split('@')
-        e1_2 = string[0].split('+')
-        self._cur_word_gpos = self.__str2str(e1_2[0])
-        self._cur_word_num_syll = self.__str2int(e1_2[1])
+    This helper function checks if a string is valid, it returns None if the
+    value is not existing (marked as 'x').
 
-        string = string[1].split('&')
-        e3_4 = string[0].split('+')
-        self._cur_word_pos_cur_phrase_forward = self.__str2int(e3_4[0])
-        self._cur_word_pos_cur_phrase_backward = self.__str2int(e3_4[1])
+    :params string: character to convert
+    :returns: given string value if valid
+    """
+    if string != 'x':
+        return string
+    else:
+        return None
 
-        string = string[1].split('#')
-        e5_6 = string[0].split('+')
-        self._cur_word_num_content_words_cur_phrase_before = self.__str2int(e5_6[0])
-        self._cur_word_num_content_words_cur_phrase_after = self.__str2int(e5_6[1])
 
-        e7_8 = string[1].split('+')
-        self._cur_word_distance_prev_content_word = self.__str2int(e7_8[0])
-        self._cur_word_distance_next_content_word = self.__str2int(e7_8[1])
+class ConversionCache(dict):
 
-    def __split_F(self, string):
-        """Parses information about the guess part-of-speech of the next word
+    """Memoizes a conversion function.
 
-        :params string: string to parse
-        """
-        string = string[2:].split('_')
-        self._next_word_gpos = self.__str2str(string[0])
-        self._next_word_num_syll = self.__str2int(string[1])
+    The values in label files repeat a lot, thus looking up an already
+    converted value is cheaper than converting it again.
+    """
 
-    def __split_G(self, string):
-        """Parses information about the number of syllables in the previous phrase
+    def __init__(self, convert):
+        """Initialises the cache for a given conversion function.
 
-        :params string: string to parse
+        :params convert: function to convert a string
         """
-        string = string[2:].split('_')
-        self._prev_phrase_num_syll = self.__str2int(string[0])
-        self._prev_phrase_num_words = self.__str2int(string[1])
+        self._convert = convert
 
-    def __split_H(self, string):
-        """Parses information about the number of syllables in the current phrase
+    def __missing__(self, string):
+        """Converts a string that is not cached yet.
 
-        :params string: string to parse
+        :params string: the string to convert
+        :returns: the converted value
         """
-        string = string[2:].split('^')
-        h1_2 = string[0].split('=')
-        self._cur_phrase_num_syll = self.__str2int(h1_2[0])
-        self._cur_phrase_num_words = self.__str2int(h1_2[1])
-
-        string = string[1].split('|')
-        h3_4 = string[0].split('=')
-        self._cur_phrase_pos_cur_utterance_forward = self.__str2int(h3_4[0])
-        self._cur_phrase_pos_cur_utterance_backward = self.__str2int(h3_4[0])
+        value = self[string] = self._convert(string)
+        return value
+
+
+# layout of a line in the HTS label format, made of the phone block (P) and the context blocks (A to J)
+PHONE_FORMAT = 'p1^p2-p3+p4=p5@p6_p7'
+CONTEXT_FORMAT = ('/A:a1_a2_a3'
+                  '/B:b1-b2-b3@b4-b5&b6-b7#b8-b9$b10-b11!b12-b13;b14-b15|b16'
+                  '/C:c1+c2+c3'
+                  '/D:d1_d2'
+                  '/E:e1+e2@e3+e4&e5+e6#e7+e8'
+                  '/F:f1_f2'
+                  '/G:g1_g2'
+                  '/H:h1=h2^h3=h4|h5'
+                  '/I:i1=i2'
+                  '/J:j1+j2-j3')
+LINE_FORMAT = PHONE_FORMAT + CONTEXT_FORMAT
+
+# the member variable and the conversion function for every field of the label format
+FIELDS = {
+    'p1': ('_LL', str2str),
+    'p2': ('_L', str2str),
+    'p3': ('_C', str2str),
+    'p4': ('_R', str2str),
+    'p5': ('_RR', str2str),
+    'p6': ('_cur_phoneme_id_pos_forward', str2int),
+    'p7': ('_cur_phoneme_id_pos_backward', str2int),
+    'a1': ('_prev_syll_stressed', char2bool),
+    'a2': ('_prev_syll_accented', char2bool),
+    'a3': ('_prev_syll_phoneme_num', str2int),
+    'b1': ('_cur_syll_stressed', char2bool),
+    'b2': ('_cur_syll_accented', char2bool),
+    'b3': ('_cur_syll_phoneme_num', str2int),
+    'b4': ('_cur_syll_pos_current_word_forward', str2int),
+    'b5': ('_cur_syll_pos_current_word_backward', str2int),
+    'b6': ('_cur_syll_pos_cur_phrase_forward', str2int),
+    'b7': ('_cur_syll_pos_cur_phrase_backward', str2int),
+    'b8': ('_cur_syll_num_stressed_sylls_before_cur_phrase', str2int),
+    'b9': ('_cur_syll_num_stressed_sylls_after_cur_phrase', str2int),
+    'b10': ('_cur_syll_num_accented_sylls_before_cur_phrase', str2int),
+    'b11': ('_cur_syll_num_accented_sylls_after_cur_phrase', str2int),
+    'b12': ('_cur_syll_distance_prev_stressed_syll', str2int),
+    'b13': ('_cur_syll_distance_next_stressed_syll', str2int),
+    'b14': ('_cur_syll_distance_prev_accented_syll', str2int),
+    'b15': ('_cur_syll_distance_next_accented_syll', str2int),
+    'b16': ('_cur_syll_vowel', str2str),
+    'c1': ('_next_syll_stressed', char2bool),
+    'c2': ('_next_syll_accented', char2bool),
+    'c3': ('_next_syll_num_phonems', str2int),
+    'd1': ('_prev_word_gpos', str2str),
+    'd2': ('_prev_word_num_syll', str2int),
+    'e1': ('_cur_word_gpos', str2str),
+    'e2': ('_cur_word_num_syll', str2int),
+    'e3': ('_cur_word_pos_cur_phrase_forward', str2int),
+    'e4': ('_cur_word_pos_cur_phrase_backward', str2int),
+    'e5': ('_cur_word_num_content_words_cur_phrase_before', str2int),
+    'e6': ('_cur_word_num_content_words_cur_phrase_after', str2int),
+    'e7': ('_cur_word_distance_prev_content_word', str2int),
+    'e8': ('_cur_word_distance_next_content_word', str2int),
+    'f1': ('_next_word_gpos', str2str),
+    'f2': ('_next_word_num_syll', str2int),
+    'g1': ('_prev_phrase_num_syll', str2int),
+    'g2': ('_prev_phrase_num_words', str2int),
+    'h1': ('_cur_phrase_num_syll', str2int),
+    'h2': ('_cur_phrase_num_words', str2int),
+    'h3': ('_cur_phrase_pos_cur_utterance_forward', str2int),
+    'h4': ('_cur_phrase_pos_cur_utterance_backward', str2int),
+    'h5': ('_cur_phrase_TOBI_endtone', str2str),
+    'i1': ('_next_phrase_num_syll', str2int),
+    'i2': ('_next_phrase_num_words', str2int),
+    'j1': ('_cur_utterance_num_syll', int),
+    'j2': ('_cur_utterance_num_words', int),
+    'j3': ('_cur_utterance_num_phrases', int),
+}
+
+
+def compile_format_regex(line_format, prefix='', suffix='', last_separator=None):
+    """Compiles one regular expression for (a part of) a line of the label format.
+
+    Every field of the format becomes a named group, which matches everything
+    up to the separator following the field. The fields of the J block only
+    match digits.
+
+    :params line_format: layout of (a part of) a line
+    :params prefix: pattern preceding the fields
+    :params suffix: pattern following the fields
+    :params last_separator: the separator following the last field, if the suffix starts with it
+    :returns: the compiled regular expression
+    :returns: list of the field names in the order of the groups
+    """
+    tokens = re.split(r'([a-jp]\d+)', line_format)
+    pattern = prefix
+    field_names = []
+
+    for i, token in enumerate(tokens):
+        if i % 2 == 0:
+            pattern += re.escape(token)
+        elif token.startswith('j'):
+            pattern += r'(?P<{:s}>\d+)'.format(token)
+            field_names.append(token)
+        else:
+            separator = tokens[i+1][0] if tokens[i+1] else last_separator
+            pattern += r'(?P<{:s}>[^{:s}]+)'.format(token, re.escape(separator))
+            field_names.append(token)
 
-        self._cur_phrase_TOBI_endtone = self.__str2str(string[1])
+    return re.compile(pattern + suffix), field_names
 
-    def __split_I(self, string):
-        """Parses information about the number of syllables in the current phrase
+TIMESTAMPS = r'^\s*(?P<begin>\d+)\s+(?P<end>\d+)\s+'
+LINE_REGEX, FIELD_NAMES = compile_format_regex(LINE_FORMAT, TIMESTAMPS)
+PHONE_REGEX, PHONE_FIELD_NAMES = compile_format_regex(PHONE_FORMAT, TIMESTAMPS, r'(?P<context>/\S*)', '/')
+CONTEXT_REGEX, CONTEXT_FIELD_NAMES = compile_format_regex(CONTEXT_FORMAT)
 
-        :params string: string to parse
-        """
-        string = string[2:].split('=')
-        self._next_phrase_num_syll = self.__str2int(string[0])
-        self._next_phrase_num_words = self.__str2int(string[1])
+CONVERSION_CACHES = {convert:ConversionCache(convert) for convert in (str2str, str2int, char2bool, int)}
+FIELD_CONVERSIONS = [(FIELDS[field][0], CONVERSION_CACHES[FIELDS[field][1]]) for field in FIELD_NAMES]
+PHONE_CONVERSIONS = [(FIELDS[field][0], CONVERSION_CACHES[FIELDS[field][1]]) for field in PHONE_FIELD_NAMES]
+CONTEXT_CONVERSIONS = [(FIELDS[field][0], CONVERSION_CACHES[FIELDS[field][1]]) for field in CONTEXT_FIELD_NAMES]
+LAZY_ATTRIBUTES = frozenset(FIELDS[field][0] for field in CONTEXT_FIELD_NAMES)
+NUMERIC_FIELDS = [field for field in FIELD_NAMES if FIELDS[field][1] is not str2str]
+CATEGORICAL_FIELDS = [field for field in FIELD_NAMES if FIELDS[field][1] is str2str and not field.startswith('p')]
 
-    def __split_J(self, string):
-        """Parses information about the number of syllables in this utterance
+class Phone:
 
-        :params string: string to parse
-        """
-        regex = re.compile(r'J:(\d+)\+(\d+)-(\d+)')
-        m = regex.match(string)
-        self._cur_utterance_num_syll = int(m.group(1))
-        self._cur_utterance_num_words = int(m.group(2))
-        self._cur_utterance_num_phrases = int(m.group(3))
+    """A phone as defined in the HTS label format
 
-    def __char2bool(self, char):
-        """Converts a character to a boolean value
+    This class parses one line (=one phone) of the HTS label format. To keep
+    the memory footprint of a parsed label small it uses slots and the
+    descriptions of the fields are only stored once in the class. By default
+    only the times and the phone block (P) are parsed when the instance is
+    created, the context blocks (A to J) are parsed on first access.
+    """
 
-        This helper method converts a given character into a boolean value or
-        returns None if the value is not existing (marked as 'x').
+    __slots__ = ('original_line', 'number', 'begin', 'end', '_context') + tuple(attribute for attribute,_ in FIELDS.values())
+
+    # description of every field of the label format
+    HELP = OrderedDict([
+        ('p1', 'the phoneme identity before the previous phoneme'),
+        ('p2', 'the previous phoneme identity'),
+        ('p3', 'the current phoneme identity'),
+        ('p4', 'the next phoneme identity'),
+        ('p5', 'the phoneme after the next phoneme identity'),
+        ('p6', 'position of the current phoneme identity in the current syllable (forward)'),
+        ('p7', 'position of the current phoneme identity in the current syllable (backward)'),
+        ('a1', 'whether the previous syllable stressed or not'),
+        ('a2', 'whether the previous syllable accented or not'),
+        ('a3', 'the number of phonemes in the previous syllable'),
+        ('b1', 'whether the current syllable stressed or not'),
+        ('b2', 'whether the current syllable accented or not'),
+        ('b3', 'the number of phonemes in the current syllable'),
+        ('b4', 'position of the current syllable in the current word (forward)'),
+        ('b5', 'position of the current syllable in the current word (backward)'),
+        ('b6', 'position of the current syllable in the current phrase (forward)'),
+        ('b7', 'position of the current syllable in the current phrase (backward)'),
+        ('b8', 'the number of stressed syllables before the current syllable in the current phrase'),
+        ('b9', 'the number of stressed syllables after the current syllable in the current phrase'),
+        ('b10', 'the number of accented syllables before the current syllable in the current phrase'),
+        ('b11', 'the number of accented syllables after the current syllable in the current phrase'),
+        ('b12', 'the distance per syllable from the previous stressed syllable to the current syllable'),
+        ('b13', 'the distance per syllable from the current syllable to the next stressed syllable'),
+        ('b14', 'the distance per syllable from the previous accented syllable to the current syllable'),
+        ('b15', 'the distance per syllable from the current syllable to the next accented syllable'),
+        ('b16', 'name of the vowel of the current syllable'),
+        ('c1', 'whether the next syllable stressed or not'),
+        ('c2', 'whether the next syllable accented or not'),
+        ('c3', 'the number of phonemes in the next syllable'),
+        ('d1', 'gpos (guess part-of-speech) of the previous word'),
+        ('d2', 'the number of syllables in the previous word'),
+        ('e1', 'gpos (guess part-of-speech) of the current word'),
+        ('e2', 'the number of syllables in the current word'),
+        ('e3', 'position of the current word in the current phrase (forward)'),
+        ('e4', 'position of the current word in the current phrase (backward)'),
+        ('e5', 'the number of content words before the current word in the current phrase'),
+        ('e6', 'the number of content words after the current word in the current phrase'),
+        ('e7', 'the distance per word from the previous content word to the current word'),
+        ('e8', 'the distance per word from the current word to the next content word'),
+        ('f1', 'gpos (guess part-of-speech) of the next word'),
+        ('f2', 'the number of syllables in the next word'),
+        ('g1', 'the number of syllables in the previous phrase'),
+        ('g2', 'the number of words in the previous phrase'),
+        ('h1', 'the number of syllables in the current phrase'),
+        ('h2', 'the number of words in the current phrase'),
+        ('h3', 'position of the current phrase in this utterance (forward)'),
+        ('h4', 'position of the current phrase in this utterance (backward)'),
+        ('h5', 'TOBI endtone of the current phrase'),
+        ('i1', 'the number of syllables in the next phrase'),
+        ('i2', 'the number of words in the next phrase'),
+        ('j1', 'the number of syllables in this utterance'),
+        ('j2', 'the number of words in this utterance'),
+        ('j3', 'the number of phrases in this utterance'),
+    ])
+
+    def __init__(self, line, number_of_phone=None, lazy=True):
+        """Initialises the instance with one line of the label file.
 
-        :params char: character to convert
-        :returns: boolean value of that character
+        :params line: the line to parse
+        :params number_of_phones: number of the phone in the lable file
+        :params lazy: whether to parse the context blocks on first access or right away
         """
-        if char != 'x':
-            return bool(int(char))
+        self.original_line = line
+        self._context = None
+        if number_of_phone:
+            self.number = number_of_phone
         else:
-            return None
+            self.number = None
 
-    def __str2int(self, string):
-        """Converts a string to an integer value
+        if lazy:
+            m = PHONE_REGEX.match(line)
+        else:
+            m = LINE_REGEX.match(line)
 
-        This helper method converts a given character into an integer value or
-        returns None if the value is not existing (marked as 'x').
+        if m is None and line.strip():
+            raise Exception('Could not parse label line: {:s}'.format(line.strip()))
 
-        :params string: string to convert
-        :returns: boolean value of that character
+        if m:
+            self.begin = int(m.group('begin')) / 1e7
+            self.end = int(m.group('end')) / 1e7
+            if lazy:
+                for (attribute, values), value in zip(PHONE_CONVERSIONS, m.groups()[2:-1]):
+                    setattr(self, attribute, values[value])
+                self._context = m.group('context')
+            else:
+                for (attribute, values), value in zip(FIELD_CONVERSIONS, m.groups()[2:]):
+                    setattr(self, attribute, values[value])
+
+    def __getattr__(self, name):
+        """Parses the context blocks or gets the description of a field.
+
+        This method is only called for attributes that are not set. If it is
+        an attribute of a context block which is not parsed yet, the context
+        blocks are parsed. The description of a field is given as
+        <field>_help.
+
+        :params name: name of the attribute
+        :returns: the value of the attribute or the description of the field
+        :raises AttributeError: if the attribute is not existing
         """
-        if string != 'x':
-            return int(string)
-        else:
-            return None
-
-    def __str2str(self, string):
-        """Checks if the given string is valid
+        if name in LAZY_ATTRIBUTES and self._context is not None:
+            self._parse_context()
+            return getattr(self, name)
+        if name.endswith('_help') and name[:-5] in Phone.HELP:
+            return Phone.HELP[name[:-5]]
+        raise AttributeError('{:s} object has no attribute {:s}'.format(type(self).__name__, name))
 
-        This helper method checks if a string is valid, it returns None if the
-        value is not existing (marked as 'x').
+    def _parse_context(self):
+        """Parses the context blocks (A to J) of the line.
 
-        :params string: character to convert
-        :returns: given string value if valid
+        :raises Exception: if the context blocks can not be parsed
         """
-        if string != 'x':
-            return string
-        else:
-            return None
+        m = CONTEXT_REGEX.match(self._context)
+        if m is None:
+            raise Exception('Could not parse label line: {:s}'.format(self.original_line.strip()))
+
+        for (attribute, values), value in zip(CONTEXT_CONVERSIONS, m.groups()):
+            setattr(self, attribute, values[value])
+        self._context = None
 
     @property
     def LL(self):
@@ -612,24 +629,19 @@ class Phone:
         return [self.p1, self.p2, self.p3, self.p4, self.p5]
 
     def print_phone(self, values_only=False):
-        members = filter(lambda x: not (x.startswith('_') or x == 'original_line' or x == 'number'), self.__dict__)
-        members.sort()
-        # put varibles starting with p in front
-        members = members[-7:] + members[0:-7]
-        # order b10 to b16 correctly
-        tmp = members[10:17]
-        [members.remove(x) for x in tmp]
-        members = members[:19] + tmp + members[19:]
+        """Prints the values of all fields together with their description.
 
+        :params values_only: whether to skip fields without a value
+        """
         print('\n#######################################################################')
         if self.number:
             print('Phone Nr.: {:d}'.format(self.number))
         print('Start: {:6.2f}'.format(self.begin))
         print('End:   {:6.2f}\n'.format(self.end))
-        for i in members:
-            if values_only:
-                if getattr(self, i.replace('_help', '')) is None:
-                    continue
+        for field, description in Phone.HELP.items():
+            value = getattr(self, field)
+            if values_only and value is None:
+                continue
 
-            form = '{:8s} {:s}'.format(str(getattr(self, i.replace('_help', ''))), self.__dict__[i])
-            print(form)
\ No newline at end of file
+            form = '{:8s} {:s}'.format(str(value), description)
+            print(form)
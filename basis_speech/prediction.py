@@ -170,6 +170,6 @@ class Prediction:
 
         label = Label(LABEL_DIR + self._filename + '.lab')
         step_size = mgc_matrix.shape[0]/label.last_phone_end
-        phone_starts = [int(round(p[1]*step_size)) for p in label.cur_phones_additions()]
+        phone_starts = label.phone_frames(step_size)[:,0].tolist()
 
         return mgc_matrix, phone_starts
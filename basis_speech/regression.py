@@ -7,25 +7,35 @@
 import os
 import pickle
 import numpy as np
-from sklearn.linear_model import LinearRegression
+try:
+    import joblib
+except ImportError:
+    # older versions of sklearn ship joblib themselves
+    from sklearn.externals import joblib
+from sklearn.linear_model import LinearRegression, SGDRegressor
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.decomposition import IncrementalPCA
 
 from resynthesize import resynthesize
-from config import MGCORD, NUM_BASES, LF0_DIR, TEST_FILES, REGRESSION_SAVED, OUT_DIR
+from config import MGCORD, NUM_BASES, LF0_DIR, LABEL_DIR, TEST_FILES, REGRESSION_SAVED, OUT_DIR, NUM_WORKERS, BATCH_SIZE
 from prediction import Prediction
-from utils import split_training_test, create_bfcr, phone_to_num
+from label import Label
+from features import feature_matrix
+from utils import split_training_test, create_bfcr_many, encode_many, phone_to_num, parallel_map
+from corpus import coefficient_store
+from model_registry import ModelRegistry
 
 class Regression:
 
     """Dummy class for saving regression related values.
 
-    This class is used to easily store the filenames of the trained regression
+    This class is used to easily store the registry of the trained regression
     models and the integer values of the phones into a binary file.
 
     """
 
     def __init__(self, models, phone_values):
-        """Initialises the instance with the filenames of the trained
+        """Initialises the instance with the registry of the trained
         regression models and the directory of the numerical phone values.
         """
         self._models = models
@@ -33,9 +43,9 @@ class Regression:
 
     @property
     def models(self):
-        """Getter for the filenames of the trained models.
+        """Getter for the registry of the trained models.
 
-        :returns: filenames of the trained models
+        :returns: an instance of ModelRegistry
         """
         return self._models
 
@@ -48,56 +58,89 @@ class Regression:
         return self._phone_values
 
 
-def train_regression(training_files, models={'Linear Regression':LinearRegression(n_jobs=8), 'Random Forest Regressor 10': RandomForestRegressor(10), 'Random Forest Regressor 50': RandomForestRegressor(50)}):
+def default_models():
+    """Creates the default regression models.
+
+    These are linear regression, a random forest regressor with 10 trees and a
+    random forest regressor with 50 trees. New instances are created on every
+    call.
+
+    :returns: a directory with the name and instance of the models
+    """
+    return {'Linear Regression': LinearRegression(n_jobs=8),
+            'Random Forest Regressor 10': RandomForestRegressor(10),
+            'Random Forest Regressor 50': RandomForestRegressor(50)}
+
+
+def fit_model(task):
+    """Fits a regression model on the data of a coefficient store.
+
+    This helper function is used by the worker processes of train_regression().
+    X and y are memory-mapped from the files written by
+    CoefficientStore.regression_data(), they already have the types the
+    estimators use (float32 X, C-contiguous float64 y), thus they are shared
+    between the workers and the random forests use them without a copy. The
+    linear regression still centres private copies of X and y. The fitted
+    model is saved with joblib.
+
+    :params task: tuple of the name of the model, the model, the filenames of X and y and the filename of the model
+    :returns: the name of the model
+    :returns: the filename of the saved model
+    """
+    key, model, X_file, y_file, model_filename = task
+    X = np.load(X_file, mmap_mode='r')
+    y = np.load(y_file, mmap_mode='r')
+
+    model.fit(X, y)
+    os.makedirs(os.path.dirname(model_filename) or '.', exist_ok=True)
+    joblib.dump(model, model_filename)
+    return key, model_filename
+
+
+def train_regression(training_files, models=None, workers=NUM_WORKERS, registry=None):
     """Trains a regression model.
 
-    This function trains a regression model for the given training files.
-    Before the training it creates a BFCR instace for all training files and
-    collects all the different phones in the test data. Once the training
-    is done it saves them as a binary file. Instead of returning a trained
-    model, it retuns the filename of the saved trained models. This is done
-    because especially the random forest regressor takes a lot of memory and
-    having multiple instance of it can easily fill up all available memory,
-    thus they are "swapped out".
-    By default the used models are linear regression, a random forest regressor
-    with 10 trees and a random forest regressor with 50 trees.
+    This function trains regression models for the given training files.
+    The quin-phones and coefficients of the training files are taken from the
+    coefficient store of the training files, which is built if it doesn't
+    exist yet. The store is filled file by file while encoding, thus no BFCR
+    instances are kept. The models are trained at the same time in a pool of
+    processes, which all memory-map X and y from files written once in the
+    types the estimators use (see CoefficientStore.regression_data()). Once
+    the training is done it saves them as a binary file.
+    Instead of returning the trained models, it retuns a registry of the saved
+    trained models. This is done because especially the random forest
+    regressor takes a lot of memory and having multiple instance of it can
+    easily fill up all available memory, thus the registry only keeps as many
+    models in memory as its memory budget allows (see ModelRegistry). A new
+    registry gets its own subdirectory of MODEL_DIR, named after the key of
+    the store, thus training again doesn't overwrite the models of a previous
+    registry. By default the used models are the ones of default_models().
 
     :params training_files: a list of training files for the models
     :params models: a directory with the name and instance of the used model
+    :params workers: maximal number of worker processes, if 1 the models are trained one after another
+    :params registry: the registry for the trained models, if None a new one is created
     :returns: an instance of the dummy class Regression
     """
-    phone_values = set()
-    BFCR_training = []
-    for i in training_files:
-        bfcr = create_bfcr(i)
-        BFCR_training.append(bfcr)
-
-        for j in bfcr.label.cur_phones():
-            phone_values.add(j)
-
-    phone_values = phone_to_num(phone_values)
-
-    y = []
-    X = []
-    for i in BFCR_training:
-        for j in i.label.phones:
-            X.append([phone_values[str(l)] for l in j.quinphone])
-
-        mgc_coefficients = i.phone_coefficients('mgc')
-        for k in range(mgc_coefficients.shape[0]):
-            y.append(mgc_coefficients[k,:])
-    X = np.reshape(X, (len(X), len(X[0])))
-    y = np.reshape(y, (len(y), (MGCORD+1)*NUM_BASES))
-
-    for key,model in models.items():
-        model.fit(X, y)
-        model_filename = key.replace(' ', '_')
-        with open('TRAINED_' + model_filename + '.pickle', 'wb') as f:
-            pickle.dump(model, f)
-        models[key] = model_filename
-        print('Trained {:s}'.format(model_filename))
-
-    regression = Regression(models, phone_values)
+    if models is None:
+        models = default_models()
+
+    store = coefficient_store(training_files, workers=workers)
+    if registry is None:
+        registry = ModelRegistry.new(store.key[:16] + '_')
+    phone_values = store.phone_values
+    X_file, y_file = store.regression_data()
+    tasks = [(key, model, X_file, y_file, registry.filename(key)) for key,model in models.items()]
+
+    trained = {}
+    for key, model_filename in parallel_map(fit_model, tasks, workers, ordered=False, chunks_per_worker=1):
+        trained[key] = model_filename
+        print('Trained {:s}'.format(key))
+
+    for key in models.keys():
+        registry.add(key, trained[key])
+    regression = Regression(registry, phone_values)
 
     with open(REGRESSION_SAVED, 'wb') as f:
         pickle.dump(regression, f)
@@ -106,6 +149,213 @@ def train_regression(training_files, models={'Linear Regression':LinearRegressio
     return regression
 
 
+class IncrementalRegression:
+
+    """A regression model which is trained on minibatches.
+
+    This class wraps a regression model with a partial_fit() method for
+    multiple outputs, by default it trains one SGD regressor per output
+    itself (MultiOutputRegressor only has partial_fit() since sklearn 0.19).
+    The quin-phones are one-hot encoded
+    (see features.feature_matrix()) as a sparse matrix, thus a linear model
+    gets one weight per phone and position instead of treating the numerical
+    values of the phones as magnitudes. Optionally the coefficients are
+    reduced with an incremental PCA, then the model predicts the principal
+    components and the predictions are projected back. Since the PCA has to be
+    fitted before the model, the PCA is fitted on its own pass over the data.
+    The input and output are the same as the ones of the models of
+    train_regression(), thus the model can be used with predict_regression().
+
+    """
+
+    def __init__(self, num_phones, estimator=None, n_components=None):
+        """Initialises an untrained model.
+
+        :params num_phones: number of different phones
+        :params estimator: a regression model with a partial_fit() method for multiple outputs, if None one SGD regressor per output is used
+        :params n_components: number of principal components of the coefficients, if None no PCA is used
+        """
+        self._num_phones = num_phones
+        self._estimator = estimator
+        self._regressors = None
+        self._pca = IncrementalPCA(n_components) if n_components is not None else None
+
+    @property
+    def uses_pca(self):
+        """Getter for whether the coefficients are reduced with a PCA."""
+        return self._pca is not None
+
+    def partial_fit_pca(self, y):
+        """Fits the PCA of the coefficients on a minibatch.
+
+        Minibatches with less phones than principal components are skipped,
+        because the incremental PCA can't be fitted on them.
+
+        :params y: the coefficients of the phones, shape (phones, (MGCORD+1) * NUM_BASES)
+        """
+        if len(y) >= self._pca.n_components:
+            self._pca.partial_fit(y)
+
+    def partial_fit(self, X, y):
+        """Fits the model on a minibatch.
+
+        :params X: the numerical values of the quin-phones, shape (phones, 5)
+        :params y: the coefficients of the phones, shape (phones, (MGCORD+1) * NUM_BASES)
+        :raises Exception: if the PCA is used but wasn't fitted on enough phones
+        """
+        if self._pca is not None:
+            if not hasattr(self._pca, 'components_'):
+                raise Exception('The PCA needs at least {:d} phones'.format(self._pca.n_components))
+            y = self._pca.transform(y)
+
+        features = self._features(X)
+        if self._estimator is not None:
+            self._estimator.partial_fit(features, y)
+            return
+
+        if self._regressors is None:
+            self._regressors = [SGDRegressor() for i in range(y.shape[1])]
+        for i,regressor in enumerate(self._regressors):
+            regressor.partial_fit(features, y[:,i])
+
+    def predict(self, X):
+        """Predicts the coefficients of the given quin-phones.
+
+        :params X: the numerical values of the quin-phones, shape (phones, 5)
+        :returns: the predicted coefficients, shape (phones, (MGCORD+1) * NUM_BASES)
+        """
+        features = self._features(X)
+        if self._estimator is not None:
+            y = self._estimator.predict(features)
+        else:
+            y = np.column_stack([regressor.predict(features) for regressor in self._regressors])
+        if self._pca is not None:
+            y = self._pca.inverse_transform(y)
+        return y
+
+    def _features(self, X):
+        """Encodes the quin-phones as sparse one-hot features.
+
+        :params X: the numerical values of the quin-phones, shape (phones, 5)
+        :returns: sparse CSR matrix of shape (phones, 5 * num_phones)
+        """
+        X = np.asarray(X).astype(np.int64)
+        empty = np.zeros((len(X), 0), dtype=np.int64)
+        return feature_matrix(X, empty, empty, self._num_phones, [], sparse=True)
+
+
+def minibatches(files, phone_values, batch_size=BATCH_SIZE, workers=NUM_WORKERS):
+    """Streams the quin-phones and coefficients of the given files in minibatches.
+
+    The files are encoded in one pool of processes (see encode_many()) with
+    at most a few files per worker in progress at once, and the phones are
+    copied into fixed buffers, thus only the buffers and a few encoded files
+    are in memory at the same time, independent of the number of files. The
+    encoded files are taken from the encoding cache, once the corpus doesn't
+    fit into the cache (CACHE_SIZE in config.py) every pass encodes the files
+    again. Every minibatch has batch_size phones,
+    except for the last one. The buffers are reused, thus a minibatch is only
+    valid until the next one is yielded.
+
+    :params files: list of files
+    :params phone_values: directory with the numerical values of the phones
+    :params batch_size: number of phones per minibatch
+    :params workers: number of worker processes for encoding
+    :returns: tuples of the float32 quin-phones (phones, 5) and the float32 coefficients (phones, (MGCORD+1) * NUM_BASES)
+    """
+    X_batch = np.empty((batch_size, 5), dtype=np.float32)
+    y_batch = np.empty((batch_size, (MGCORD+1) * NUM_BASES), dtype=np.float32)
+    filled = 0
+    max_pending = 4 * max(1, workers or os.cpu_count())
+
+    for encoded in encode_many(files, workers, max_pending=max_pending):
+        X = quinphone_features(encoded, phone_values)
+        y = np.reshape(encoded.coefficients, (len(X), -1))
+
+        position = 0
+        while position < len(X):
+            n = min(batch_size - filled, len(X) - position)
+            X_batch[filled:filled+n] = X[position:position+n]
+            y_batch[filled:filled+n] = y[position:position+n]
+            filled += n
+            position += n
+            if filled == batch_size:
+                yield X_batch, y_batch
+                filled = 0
+
+    if filled > 0:
+        yield X_batch[:filled], y_batch[:filled]
+
+
+def train_regression_incremental(training_files, name='SGD Regressor', estimator=None, n_components=None, epochs=5,
+                                 batch_size=BATCH_SIZE, workers=NUM_WORKERS, registry=None, seed=0):
+    """Trains a regression model out-of-core.
+
+    Unlike train_regression(), which needs all quin-phones and coefficients in
+    memory, this function streams them in minibatches (see minibatches())
+    from the encoded training files, thus the memory needed doesn't depend on
+    the size of the corpus. The phones are collected from the labels first,
+    afterwards the PCA of the coefficients is fitted on one pass (if used) and
+    the model on the given number of passes over the files. The order of the
+    files is shuffled for every pass. Encoded files are taken from the encoding
+    cache, thus only the first pass needs to encode them as long as the
+    corpus fits into the cache, else every pass encodes them again.
+    The trained model is saved in the registry and a Regression instance with
+    the registry is returned, it isn't saved to REGRESSION_SAVED.
+
+    :params training_files: a list of training files for the model
+    :params name: the name of the model in the registry
+    :params estimator: a regression model with a partial_fit() method for multiple outputs, if None one SGD regressor per output is used
+    :params n_components: number of principal components of the coefficients, if None no PCA is used
+    :params epochs: number of passes over the training files
+    :params batch_size: number of phones per minibatch
+    :params workers: number of worker processes for encoding
+    :params registry: the registry for the trained model, if None a new one is created in its own subdirectory of MODEL_DIR
+    :params seed: seed for shuffling the files
+    :returns: an instance of the dummy class Regression
+    :raises Exception: if the PCA is used and there are less phones than principal components
+    """
+    if registry is None:
+        registry = ModelRegistry.new(name.replace(' ', '_') + '_')
+
+    phones = set()
+    for f in training_files:
+        label = Label(LABEL_DIR + os.path.splitext(os.path.basename(f))[0] + '.lab')
+        phones.update(p for p in label.phone_names if p is not None)
+    phone_values = phone_to_num(phones)
+
+    model = IncrementalRegression(len(phones), estimator, n_components)
+    files = list(training_files)
+    random_state = np.random.RandomState(seed)
+
+    if model.uses_pca:
+        for _, y in minibatches(files, phone_values, batch_size, workers):
+            model.partial_fit_pca(y)
+        print('Fitted PCA')
+
+    for epoch in range(epochs):
+        random_state.shuffle(files)
+        for X, y in minibatches(files, phone_values, batch_size, workers):
+            model.partial_fit(X, y)
+        print('Trained {:s} epoch {:d}/{:d}'.format(name, epoch+1, epochs))
+
+    registry.save(name, model)
+    print('Saving done')
+
+    return Regression(registry, phone_values)
+
+
+def quinphone_features(label, phone_values):
+    """Converts the quin-phones of a label into the input of the regression models.
+
+    :params label: an instance of the Label class or an EncodedFile tuple
+    :params phone_values: directory with the numerical values of the phones
+    :returns: float32 array of shape (phones, 5)
+    """
+    codes = np.array([phone_values[str(p)] for p in label.phone_names] + [-1], dtype=np.float32)
+    return codes[label.quinphone_codes]
+
+
 def predict_regression(regression, test_files, output_dir=None, create_original=True):
     """Predicts for the given test files from given regression models.
 
@@ -113,6 +363,8 @@ def predict_regression(regression, test_files, output_dir=None, create_original=
     test files for all given regression models as well as a *.wav file from the
     original matrix. Furthermore it  adds the predicted values to a list of the
     prediction class, which is used for creating plots.
+    The quin-phones of all test files are predicted with one call per model,
+    the predictions are split into the files afterwards.
     If a trained model that is given in the regression istance is not found
     this function prints an error message and continues.
 
@@ -131,35 +383,34 @@ def predict_regression(regression, test_files, output_dir=None, create_original=
     if output_dir is None:
         output_dir = 'wavs/regression/'
 
-    BFCR_test = []
-    for i in test_files:
-        bfcr = create_bfcr(i)
-        BFCR_test.append(bfcr)
+    BFCR_test = create_bfcr_many(test_files)
 
+    for test_file, bfcr in zip(test_files, BFCR_test):
         if create_original:
             original_mgc = bfcr.original_matrix('mgc')
-            lf0_filename = LF0_DIR + i + '.lf0'
-            resynthesize(original_mgc, lf0_filename, output_dir + '{0:s}_original.wav'.format(i))
+            lf0_filename = LF0_DIR + test_file + '.lf0'
+            resynthesize(original_mgc, lf0_filename, output_dir + '{0:s}_original.wav'.format(test_file))
 
     predictions = [Prediction(os.path.splitext(os.path.basename(bfcr.label_file))[0]) for bfcr in BFCR_test]
 
-    for k,v in models.items():
+    X = [quinphone_features(bfcr.label, phone_values) for bfcr in BFCR_test]
+    offsets = np.zeros(len(X)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in X])
+    X = np.vstack(X)
+
+    for k in models.keys():
         try:
-            with open('TRAINED_' + v + '.pickle', 'rb') as f:
-                loaded_model = pickle.load(f)
-                print('Loaded: {:s}'.format(v))
+            loaded_model = models.get(k)
+            print('Loaded: {:s}'.format(k))
         except FileNotFoundError:
-            print('Could not open {:s}'.format('TRAINED_' + v + '.pickle'))
-
-        for i, bfcr in enumerate(BFCR_test):
-            X = []
-            for j in bfcr.label.phones:
-                X.append([phone_values[str(l)] for l in j.quinphone])
+            print('Could not open {:s}'.format(models.filename(k)))
+            continue
 
-            X = np.reshape(X, (len(X), len(X[0])))
-            y = loaded_model.predict(X)
+        y = loaded_model.predict(X)
 
-            bfcr.encoded_features = {'mgc':np.reshape(y, (y.shape[0], MGCORD+1, NUM_BASES))}
+        for i, (test_file, bfcr) in enumerate(zip(test_files, BFCR_test)):
+            coefficients = y[offsets[i]:offsets[i+1]]
+            bfcr.encoded_features = {'mgc':np.reshape(coefficients, (coefficients.shape[0], MGCORD+1, NUM_BASES))}
             predicted_mgc = bfcr.decode_feature('mgc')
 
             xmax_predicted = predicted_mgc.shape[0]
@@ -167,8 +418,8 @@ def predict_regression(regression, test_files, output_dir=None, create_original=
 
             predictions[i].add(k, x_prediction, predicted_mgc)
 
-            lf0_filename = LF0_DIR + test_files[i] + '.lf0'
-            resynthesize(predicted_mgc, lf0_filename, output_dir + '{0:s}_reconstructed_{1:s}.wav'.format(test_files[i], k.replace(' ', '_')))
+            lf0_filename = LF0_DIR + test_file + '.lf0'
+            resynthesize(predicted_mgc, lf0_filename, output_dir + '{0:s}_reconstructed_{1:s}.wav'.format(test_file, k.replace(' ', '_')))
 
     print('Predicting and resynthesising done')
     return predictions
@@ -7,20 +7,20 @@ import os
 import pickle
 
 from utils import split_training_test
-from config import REGRESSION_SAVED, GMM_SAVED, TEST_FILES
+from config import REGRESSION_SAVED, GMM_BANK, TEST_FILES
 from regression import train_regression, predict_regression
 from gm_fitting import train_gmm, predict_gmm
+from gmm_bank import GMMBank
 
 if __name__ == '__main__':
     #trains all models and creates predictions for them
-    if not os.path.exists(REGRESSION_SAVED) or not os.path.exists(GMM_SAVED):
+    if not os.path.exists(REGRESSION_SAVED) or not os.path.exists(GMM_BANK):
         training_files, test_files = split_training_test()
 
         regression = train_regression(training_files)
         hgm = train_gmm(training_files)
     else:
-        with open(GMM_SAVED, 'rb') as f:
-            hgm = pickle.load(f)
+        hgm = GMMBank(GMM_BANK)
         with open(REGRESSION_SAVED, 'rb') as f:
             regression = pickle.load(f)
 
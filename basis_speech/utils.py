@@ -8,10 +8,17 @@ import os
 import random
 import numpy as np
 from glob import glob
-from collections import OrderedDict
+from functools import partial
+from collections import OrderedDict, namedtuple, deque
+from multiprocessing import Pool
 
 from bfcr import BFCR
-from config import LABEL_DIR, TEST_SIZE, NUM_BASES, MGCORD, MGC_DIR, TRAINING_FILES, TEST_FILES
+from label import Label
+from cache import EncodingCache
+from config import LABEL_DIR, TEST_SIZE, NUM_BASES, MGCORD, MGC_DIR, TRAINING_FILES, TEST_FILES, NUM_WORKERS
+
+EncodedFile = namedtuple('EncodedFile', ['filename', 'coefficients', 'phone_frames', 'begins', 'ends', 'phone_names',
+                                         'quinphone_codes', 'numeric_contexts', 'categorical_contexts'])
 
 def split_training_test(prefix=None, test_size=TEST_SIZE):
     """Divides the files into training and test files.
@@ -51,14 +58,16 @@ def split_training_test(prefix=None, test_size=TEST_SIZE):
     return training_files, test_files
 
 
-def create_bfcr(filename):
+def create_bfcr(filename, use_cache=True):
     """Creates a BFCR instance for a given file.
 
     This helper function loads a label file and its corrosponding mgc file and
     creates a bfcr file from them. The paths of both files are determined
-    automatically.
+    automatically. By default the encoded file is taken from the encoding
+    cache, if it is not cached yet it gets encoded and added to the cache.
 
     :params filename: filename from which the BFCR instaces are created
+    :params use_cache: whether to use the encoding cache or not
     :returns: an instance of the BFCR class
     """
     filename = os.path.splitext(os.path.basename(filename))[0]
@@ -66,12 +75,135 @@ def create_bfcr(filename):
     label_file = LABEL_DIR + filename + '.lab'
     mgc_file = MGC_DIR + filename + '.mgc'
 
+    if use_cache:
+        cache = EncodingCache()
+        bfcr = cache.load(label_file, mgc_file, NUM_BASES)
+        if bfcr is not None:
+            return bfcr
+
     mgc_matrix = np.fromfile(mgc_file, dtype=np.float32).reshape(-1, MGCORD+1)
     bfcr = BFCR(label_file)
     bfcr.encode_feature(mgc_matrix, 'mgc', NUM_BASES)
+
+    if use_cache:
+        cache.store(bfcr, label_file, mgc_file, NUM_BASES)
     return bfcr
 
 
+def parallel_map(func, items, workers=NUM_WORKERS, ordered=True, chunks_per_worker=4, max_pending=None):
+    """Applies a function to all given items in a pool of processes.
+
+    This helper function yields the result of func for every item, either in
+    the order of the items or in the order they are finished. The items are
+    sent to the workers in chunks, every worker gets about chunks_per_worker
+    chunks. If max_pending is given, the items are sent one by one and at most
+    that many results are in progress or waiting at once, thus the memory of
+    the results stays bounded if they are consumed slower than they are
+    computed, then the results are always yielded in order. No more processes than items are started and if only one worker
+    is used no processes are started at all. The default number of workers is
+    stored in config.py.
+
+    :params func: the function to apply, it has to be picklable
+    :params items: list of items
+    :params workers: number of worker processes, if None one per CPU
+    :params ordered: whether to yield the results in the order of the items
+    :params chunks_per_worker: number of chunks per worker
+    :params max_pending: maximal number of items in progress at once, if None it is not bounded
+    :returns: the result of func for every item
+    """
+    if workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    processes = max(1, min(workers or os.cpu_count(), len(items)))
+    chunksize = max(1, len(items) // (chunks_per_worker * processes))
+    with Pool(processes) as pool:
+        if max_pending is not None:
+            pending = deque()
+            for item in items:
+                if len(pending) >= max_pending:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(func, (item,)))
+            while pending:
+                yield pending.popleft().get()
+            return
+
+        results = pool.imap(func, items, chunksize) if ordered else pool.imap_unordered(func, items, chunksize)
+        for result in results:
+            yield result
+
+
+def encode_file(filename, contexts=False):
+    """Encodes a given file into its compact form.
+
+    This helper function creates a BFCR instance for a given file and only
+    keeps the coefficients and the frames of the phones and the columnar view
+    of the label (the times and the quin-phone codes of the phones, see
+    Label.from_columns()). This way the result is cheap to transfer between
+    processes. The context fields of the phones need the context blocks of all
+    phones to be parsed, thus they are only kept if they are asked for, else
+    they are None.
+
+    :params filename: filename of the file to encode
+    :params contexts: whether to keep the numerical and categorical context fields
+    :returns: an EncodedFile tuple
+    """
+    bfcr = create_bfcr(filename)
+    label = bfcr.label
+    filename = os.path.splitext(os.path.basename(filename))[0]
+    phone_frames = np.array(bfcr.phone_frames('mgc'), dtype=np.int64).reshape(-1, 2)
+    numeric_contexts = label.numeric_contexts if contexts else None
+    categorical_contexts = label.categorical_contexts if contexts else None
+    return EncodedFile(filename, np.asarray(bfcr.encoded_features['mgc']), phone_frames, label.begins, label.ends,
+                       label.phone_names, label.quinphone_codes, numeric_contexts, categorical_contexts)
+
+
+def encode_many(files, workers=NUM_WORKERS, contexts=False, max_pending=None):
+    """Encodes the given files in a pool of processes.
+
+    This helper function parses the labels and encodes the mgc files of all
+    given files in parallel (see parallel_map()) and yields the results in
+    the order of the given files.
+
+    :params files: list of files to encode
+    :params workers: number of worker processes
+    :params contexts: whether to keep the numerical and categorical context fields (see encode_file())
+    :params max_pending: maximal number of files in progress at once, if None it is not bounded
+    :returns: an EncodedFile tuple for every file
+    """
+    return parallel_map(partial(encode_file, contexts=contexts), files, workers, max_pending=max_pending)
+
+
+def create_bfcr_many(files, workers=NUM_WORKERS):
+    """Creates BFCR instances for the given files in a pool of processes.
+
+    This helper function does the same as create_bfcr() for a list of files.
+    The labels are parsed and the mgc files are encoded in parallel by
+    encode_many(), the labels are created again from their columnar view (see
+    Label.from_columns()), thus no label is parsed twice. Such labels don't
+    have the context fields of the phones. The mgc matrices are memory-mapped
+    from their files. If only one worker is used create_bfcr() is used
+    directly.
+
+    :params files: list of files from which the BFCR instances are created
+    :params workers: number of worker processes
+    :returns: list of BFCR instances
+    """
+    if workers == 1:
+        return [create_bfcr(f) for f in files]
+
+    bfcrs = []
+    for encoded in encode_many(files, workers):
+        bfcr = BFCR()
+        bfcr.label = Label.from_columns(encoded.begins, encoded.ends, encoded.phone_names, encoded.quinphone_codes)
+        bfcr.label_file = LABEL_DIR + encoded.filename + '.lab'
+        mgc_matrix = np.memmap(MGC_DIR + encoded.filename + '.mgc', dtype=np.float32, mode='r').reshape(-1, MGCORD+1)
+        bfcr.set_encoded_feature('mgc', encoded.coefficients, encoded.phone_frames, mgc_matrix)
+        bfcrs.append(bfcr)
+    return bfcrs
+
+
 def phone_to_num(phone_values):
     """Converts all phone strings into numerical values.
 